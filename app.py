@@ -418,7 +418,12 @@ async def chat_stream(body: StreamChatBody, request: Request) -> Response:
         # We do not reconstruct full text here; clients typically do
         yield _sse_header({"done": True, "sources": sources_payload})
 
-    return StreamingResponse(iterator(), media_type="text/event-stream")
+    return StreamingResponse(
+        iterator(),
+        media_type="text/event-stream",
+        # keep nginx & co. from buffering tokens until the reply is done
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/chat")
@@ -182,7 +182,7 @@ async def chat_stream(body: StreamChatBody, request: Request) -> Response:
     return StreamingResponse(
         iterator(),
         media_type="text/plain",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
     )
 
 @app.post("/chat")
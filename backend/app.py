@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 import os
 import json
+import threading
 import time
+import uuid
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
@@ -406,24 +408,126 @@ def _get_current_rag_state() -> bool:
 def kb_reload(request: Request) -> Dict[str, Any]:
     _require_auth(request)
     # Run indexer script located under backend/chat_core
-    import subprocess
+    return _rebuild_kb()
+
+
+# ---- Background reindex: POST /kb/reload/start + GET /kb/reload/{job_id}/events ----
+_REINDEX_JOBS: Dict[str, Dict[str, Any]] = {}
+_REINDEX_LOCK = threading.Lock()  # guards _REINDEX_JOBS
+# held for every index_kb.py run (sync or background), so two runs never
+# write faiss.index / meta.json at the same time
+_INDEXER_LOCK = threading.Lock()
+
+
+def _indexer_script() -> Path:
     script = (ROOT / "backend" / "chat_core" / "index_kb.py").resolve()
     if not script.is_file():
         raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND", "detail": str(script)}})
+    return script
+
+
+def _run_reindex_job(job: Dict[str, Any], script: Path) -> None:
+    """Run the indexer, deriving progress from its per-file [OK]/[SKIP] lines."""
+    import subprocess
+    docs_dir = (ROOT / "workdir" / "docs").resolve()
     try:
-        subprocess.run([sys.executable, str(script)], check=True)
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail={"error": {"code": "INDEX_FAILED", "detail": str(e)}})
-    return kb_stats()
+        total = sum(1 for p in docs_dir.rglob("*") if p.is_file()) if docs_dir.is_dir() else 0
+    except Exception:
+        total = 0
+    done = 0
+    try:
+        with _INDEXER_LOCK:
+            # from here on the job no longer picks up newly saved files
+            job["status"] = "indexing"
+            proc = subprocess.Popen([sys.executable, "-u", str(script)], stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, text=True)
+            for line in proc.stdout:
+                line = line.strip()
+                if line.startswith(("[OK]", "[SKIP]")):
+                    done += 1
+                    # file pass is ~80% of the work; embedding is the rest
+                    job["progress"] = min(0.8, 0.8 * done / total) if total else 0.4
+                    job["status"] = line
+                elif line.startswith("Embedding"):
+                    job["progress"] = max(job["progress"], 0.85)
+                    job["status"] = line
+            if proc.wait() != 0:
+                raise RuntimeError(f"indexer exited with {proc.returncode}")
+        job["stats"] = kb_stats()
+        job["progress"] = 1.0
+        job["status"] = "done"
+    except Exception as e:
+        job["error"] = str(e)
+        job["status"] = "error"
+    finally:
+        job["finished"] = True
+
+
+def _start_reindex_job() -> str:
+    """Start a background reindex and return its job_id.
+
+    A job still waiting to run ("starting") is reused rather than queueing
+    another: it will pick up every file on disk when it runs. A job already
+    indexing may miss files saved since, so a new one queues behind it.
+    """
+    script = _indexer_script()
+    with _REINDEX_LOCK:
+        for job_id, job in _REINDEX_JOBS.items():
+            if job["status"] == "starting":
+                return job_id
+        # keep only the most recent jobs
+        for old in list(_REINDEX_JOBS)[:-8]:
+            if _REINDEX_JOBS[old]["finished"]:
+                del _REINDEX_JOBS[old]
+        job_id = uuid.uuid4().hex
+        job = _REINDEX_JOBS[job_id] = {"progress": 0.0, "status": "starting", "finished": False}
+    threading.Thread(target=_run_reindex_job, args=(job, script), daemon=True).start()
+    return job_id
+
+
+@app.post("/kb/reload/start")
+def kb_reload_start(request: Request) -> Dict[str, Any]:
+    """Start a reindex in the background; returns its job_id immediately."""
+    _require_auth(request)
+    return {"job_id": _start_reindex_job()}
+
+
+@app.get("/kb/reload/{job_id}/events")
+async def kb_reload_events(job_id: str, request: Request):
+    """SSE stream of {"progress": 0..1, "status": ...} until the job finishes."""
+    _require_auth(request)
+    with _REINDEX_LOCK:
+        job = _REINDEX_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND", "detail": job_id}})
+
+    async def iterator():
+        import asyncio
+        last = None
+        while True:
+            snap = (job["progress"], job["status"])
+            if snap != last:
+                last = snap
+                yield _sse_header({"progress": snap[0], "status": snap[1], "done": False})
+            if job["finished"]:
+                yield _sse_header({"progress": job["progress"], "status": job["status"], "done": True,
+                                   "error": job.get("error"), "stats": job.get("stats")})
+                return
+            await asyncio.sleep(0.25)
+
+    return StreamingResponse(
+        iterator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 def _rebuild_kb() -> Dict[str, Any]:
     import subprocess
-    script = (ROOT / "backend" / "chat_core" / "index_kb.py").resolve()
-    if not script.is_file():
-        raise HTTPException(status_code=404, detail={"error": {"code": "NOT_FOUND", "detail": str(script)}})
+    script = _indexer_script()
     try:
-        subprocess.run([sys.executable, str(script)], check=True)
+        with _INDEXER_LOCK:  # waits for a background job in progress
+            subprocess.run([sys.executable, str(script)], check=True)
     except subprocess.CalledProcessError as e:
         raise HTTPException(status_code=500, detail={"error": {"code": "INDEX_FAILED", "detail": str(e)}})
     return kb_stats()
@@ -459,7 +563,13 @@ def kb_stats() -> Dict[str, Any]:
 
 
 @app.post("/kb/upload")
-async def kb_upload(request: Request, files: List[UploadFile] = File(...)) -> Dict[str, Any]:
+async def kb_upload(request: Request, files: List[UploadFile] = File(...),
+                    background: bool = Query(False)) -> Dict[str, Any]:
+    """Save files into the docs dir and reindex.
+
+    ?background=1 starts (or joins) a background reindex and returns its
+    job_id instead of blocking on a synchronous rebuild.
+    """
     _require_auth(request)
     docs_dir = (ROOT / "workdir" / "docs").resolve()
     docs_dir.mkdir(parents=True, exist_ok=True)
@@ -472,6 +582,8 @@ async def kb_upload(request: Request, files: List[UploadFile] = File(...)) -> Di
             saved.append(dest.name)
         except Exception as e:
             raise HTTPException(status_code=500, detail={"error": {"code": "UPLOAD_FAILED", "detail": str(e)}})
+    if background:
+        return {"saved": saved, "docs_dir": str(docs_dir), "job_id": _start_reindex_job()}
     stats = _rebuild_kb()
     return {"saved": saved, "docs_dir": str(docs_dir), "kb": stats}
 
@@ -646,7 +758,12 @@ async def chat_stream(body: StreamChatBody, request: Request) -> Response:
         # We do not reconstruct full text here; clients typically do
         yield _sse_header({"done": True, "sources": sources_payload})
 
-    return StreamingResponse(iterator(), media_type="text/event-stream")
+    return StreamingResponse(
+        iterator(),
+        media_type="text/event-stream",
+        # keep nginx & co. from buffering tokens until the reply is done
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/chat")
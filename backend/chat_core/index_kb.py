@@ -55,6 +55,17 @@ TITLES_NPY_PATH  = KB / "titles.npy"           # <— new: title embedding matri
 # Strong default embeddings: use BGE base v1.5 (768-dim) to match retriever/FAISS
 MODEL_NAME = os.environ.get("EMB_MODEL", "BAAI/bge-base-en-v1.5")
 
+# ── Index type ─────────────────────────────────────────────────────────────────
+# "auto" picks exact (SQ8) / IVF+HNSW+PQ by corpus size; any other value is passed to
+# faiss.index_factory as-is (e.g. "Flat", "IVF1024,Flat", "HNSW32").
+INDEX_FACTORY = os.environ.get("KB_INDEX_FACTORY", "auto")
+# Storage for the exact-search tier: "sq8" (int8 codes, 4x smaller than fp32),
+# "fp16" (2x smaller) or "none" (raw fp32). Larger tiers are PQ-compressed.
+INDEX_QUANT = os.environ.get("KB_INDEX_QUANT", "sq8").lower()
+_EXACT_SPECS = {"sq8": "SQ8", "fp16": "SQfp16", "none": "Flat"}
+FLAT_MAX = 10_000          # exact search is fast enough below this
+IVF_SMALL_MAX = 1_000_000  # larger corpora get more lists and finer PQ codes
+
 # ── Supported extensions ───────────────────────────────────────────────────────
 SUPPORTED_EXTS = {
     ".txt", ".md", ".markdown", ".pdf", ".docx", ".html", ".htm",
@@ -262,6 +273,29 @@ def guess_title(text: str, fallback: str) -> str:
     return fallback[:160]
 
 # ── Indexing ───────────────────────────────────────────────────────────────────
+def _factory_string(n: int, d: int) -> str:
+    if INDEX_FACTORY != "auto":
+        return INDEX_FACTORY
+    if n < FLAT_MAX:
+        return _EXACT_SPECS.get(INDEX_QUANT, "SQ8")
+    if n < IVF_SMALL_MAX:
+        nlist = min(4096, max(256, int(4 * n ** 0.5)))
+        return f"OPQ32_128,IVF{nlist}_HNSW32,PQ32"
+    return "OPQ64_256,IVF16384_HNSW32,PQ64"
+
+def build_index(vecs: np.ndarray) -> "faiss.Index":
+    """Build an inner-product index sized to the corpus (trained if needed)."""
+    vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+    faiss.normalize_L2(vecs)  # inner product == cosine, also for quantized codes
+    n, d = vecs.shape
+    spec = _factory_string(n, d)
+    index = faiss.index_factory(d, spec, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        print(f"Training {spec} on {n} vectors …")
+        index.train(vecs)
+    index.add(vecs)
+    return index
+
 def main():
     files = [p for p in DOCS.rglob("*")
              if p.is_file() and p.suffix.lower() in SUPPORTED_EXTS]
@@ -336,9 +370,8 @@ def main():
         normalize_embeddings=True
     )
 
-    # Build FAISS IP index
-    index = faiss.IndexFlatIP(vecs.shape[1])
-    index.add(vecs)
+    # Build FAISS IP index (int8 exact search for small KBs, IVF/HNSW/PQ beyond)
+    index = build_index(vecs)
 
     # Title embeddings matrix (order == titles_ordered)
     print(f"Embedding {len(titles_ordered)} titles …")
@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 import os
 import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 import numpy as np
@@ -27,6 +31,79 @@ TITLES_NPY = KB / "titles.npy"                    # optional (added by index_kb.
 # Default to base (768-dim) to align with current FAISS index
 MODEL_NAME = os.environ.get("EMB_MODEL", "BAAI/bge-base-en-v1.5")
 
+faiss.omp_set_num_threads(int(os.environ.get("FAISS_THREADS", os.cpu_count() or 1)))
+
+# Query micro-batching window; 0 disables batching (encode inline)
+EMBED_BATCH_MS = float(os.environ.get("RAG_EMBED_BATCH_MS", 4))
+EMBED_BATCH_MAX = int(os.environ.get("RAG_EMBED_BATCH_MAX", 32))
+
+
+class BatchedEmbedder:
+    """Coalesce concurrent single-query encodes into one model.encode call.
+
+    Callers block in embed(); a daemon worker takes the first pending query,
+    waits up to `max_wait_ms` for more (or until `max_batch`), encodes them
+    together and hands each caller its row.
+    """
+
+    def __init__(self, model: "SentenceTransformer", max_batch: int = 32, max_wait_ms: float = 4.0):
+        self.model = model
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._q: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="rag-embedder", daemon=True)
+        self._worker.start()
+
+    def embed(self, text: str) -> np.ndarray:
+        fut: Future = Future()
+        self._q.put((text, fut))
+        return fut.result()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                vecs = self.model.encode([t for t, _ in batch], batch_size=self.max_batch,
+                                         convert_to_numpy=True)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), vec in zip(batch, vecs):
+                fut.set_result(vec)
+
+
+# Model + embedder are shared by every Retriever instance in the process, so
+# per-request Retriever construction (backend) still batches across users.
+_SHARED_LOCK = threading.Lock()
+_MODELS: Dict[str, "SentenceTransformer"] = {}
+_EMBEDDERS: Dict[str, BatchedEmbedder] = {}
+
+def _shared_model(name: str) -> "SentenceTransformer":
+    with _SHARED_LOCK:
+        if name not in _MODELS:
+            _MODELS[name] = SentenceTransformer(name)
+        return _MODELS[name]
+
+def _shared_embedder(name: str) -> Optional[BatchedEmbedder]:
+    if EMBED_BATCH_MS <= 0:
+        return None
+    model = _shared_model(name)
+    with _SHARED_LOCK:
+        if name not in _EMBEDDERS:
+            _EMBEDDERS[name] = BatchedEmbedder(model, EMBED_BATCH_MAX, EMBED_BATCH_MS)
+        return _EMBEDDERS[name]
+
+
 class Retriever:
     def __init__(self, top_k: int = 4):
         # knobs (env overrides)
@@ -48,8 +125,15 @@ class Retriever:
         if not INDEX_PATH.is_file() or not META_PATH.is_file():
             raise FileNotFoundError(f"Missing KB files. Expected:\n  {INDEX_PATH}\n  {META_PATH}")
 
-        self.model = SentenceTransformer(MODEL_NAME)
+        self.model = _shared_model(MODEL_NAME)
+        self._embedder = _shared_embedder(MODEL_NAME)
         self.index = faiss.read_index(str(INDEX_PATH))
+        # IVF indexes (see index_kb.build_index) scan `nprobe` lists per query
+        self.nprobe: int = int(os.environ.get("RAG_NPROBE", 16))
+        try:
+            faiss.ParameterSpace().set_index_parameter(self.index, "nprobe", self.nprobe)
+        except Exception:
+            pass  # Flat/HNSW indexes have no nprobe
         # FAISS is inner-product; ensure query vectors are normalized too
         self.normalize = True
 
@@ -98,11 +182,29 @@ class Retriever:
 
     # ---- utilities ----
     def _encode_query(self, query: str) -> np.ndarray:
-        q = self.model.encode([query], convert_to_numpy=True)
+        if self._embedder is None:
+            return self._encode_queries([query])
+        return self._normalize_queries(self._embedder.embed(query)[None, :])
+
+    def embed(self, query: str) -> np.ndarray:
+        """Normalized query embedding, shape (d,)."""
+        return self._encode_query(query)[0]
+
+    def embed_batch(self, queries: List[str]) -> np.ndarray:
+        """Normalized query embeddings in one encode call, shape (n, d)."""
+        return self._encode_queries(list(queries))
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        return self._normalize_queries(self.model.encode(queries, convert_to_numpy=True))
+
+    def _normalize_queries(self, q: np.ndarray) -> np.ndarray:
         if self.normalize:
             q = q / (np.linalg.norm(q, axis=1, keepdims=True) + 1e-12)
         return q.astype(np.float32)
 
+    def _vec_search(self, q: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return self.index.search(q, min(self.vec_k, len(self.meta)))
+
     @staticmethod
     def _minmax(arr: np.ndarray) -> np.ndarray:
         if arr.size == 0:
@@ -132,8 +234,10 @@ class Retriever:
         return { self._titles_list[i]: float(sims_norm[i]) for i in range(len(self._titles_list)) }
 
     # ---- hybrid rank (vector + BM25 + title boost) ----
-    def _hybrid_rank(self, query: str) -> List[Tuple[int, float, float, float, float, float]]:
+    def _hybrid_rank(self, query: str, q: np.ndarray,
+                     hits: Tuple[np.ndarray, np.ndarray]) -> List[Tuple[int, float, float, float, float, float]]:
         """
+        `q` is the encoded query (1, d) and `hits` its (D, I) rows from the index.
         Returns list of tuples:
           (chunk_idx, vec_norm, bm25_norm, fused_hybrid, title_sim_norm, total_score)
         sorted by total_score desc.
@@ -141,12 +245,10 @@ class Retriever:
         if not self.meta:
             return []
 
-        # Vector search
-        q = self._encode_query(query)
-        vec_k = min(self.vec_k, len(self.meta))
-        D, I = self.index.search(q, vec_k)
-        vec_ids = [int(i) for i in I[0] if i >= 0]
-        vec_scores = [float(s) for s in D[0][:len(vec_ids)]]
+        # Vector search results
+        D, I = hits
+        vec_ids = [int(i) for i in I if i >= 0]
+        vec_scores = [float(s) for s in D[:len(vec_ids)]]
         vec_map = dict(zip(vec_ids, vec_scores))
 
         # BM25
@@ -244,11 +346,38 @@ class Retriever:
         return selected
 
     # ---- public search ----
-    def search(self, query: str, *, top_k: Optional[int] = None) -> List[Dict]:
+    def search(self, query: str, *, top_k: Optional[int] = None,
+               embedding: Optional[np.ndarray] = None) -> List[Dict]:
+        """Pass `embedding` (from embed) to skip encoding the query again."""
+        if not self.meta:
+            return []
+        qv = self._encode_query(query) if embedding is None else np.asarray(embedding).reshape(1, -1)
+        D, I = self._vec_search(qv)
+        return self._search_one(query, qv, (D[0], I[0]), top_k)
+
+    def search_batch(self, queries: List[str], *, top_k: Optional[int] = None,
+                     embeddings: Optional[np.ndarray] = None) -> List[List[Dict]]:
+        """Like search() for many queries: one encode call and one FAISS search.
+
+        Pass `embeddings` (from embed_batch) to skip the encode step.
+        """
+        if not queries:
+            return []
+        if not self.meta:
+            return [[] for _ in queries]
+        Q = self._encode_queries(list(queries)) if embeddings is None else embeddings
+        D, I = self._vec_search(Q)
+        return [
+            self._search_one(query, Q[i:i + 1], (D[i], I[i]), top_k)
+            for i, query in enumerate(queries)
+        ]
+
+    def _search_one(self, query: str, qv: np.ndarray,
+                    hits: Tuple[np.ndarray, np.ndarray], top_k: Optional[int]) -> List[Dict]:
         k_final = int(top_k) if top_k is not None else self.top_k
 
         # 1) hybrid rank (+ title boost)
-        ranked = self._hybrid_rank(query)
+        ranked = self._hybrid_rank(query, qv, hits)
         if not ranked:
             return []
 
@@ -260,7 +389,6 @@ class Retriever:
             pool = self._rerank(query, pool, limit=len(pool))
 
         # 3) MMR diversity on the pool
-        qv = self._encode_query(query)
         final_ids = self._mmr(qv, pool, k=k_final, lambda_mult=self.mmr_lambda)
 
         # 4) build results; include scores for transparency
@@ -275,4 +403,4 @@ class Retriever:
             m["score_title"] = t
             m["score_total"] = tot
             out.append(m)
-        return out
\ No newline at end of file
+        return out
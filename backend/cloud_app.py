@@ -320,7 +320,7 @@ async def chat_stream(body: StreamChatBody, request: Request) -> Response:
     return StreamingResponse(
         generate_response(),
         media_type="text/plain",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
     )
 
 @app.post("/chat")
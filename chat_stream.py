@@ -1,12 +1,36 @@
 #!/usr/bin/env python3
 import os
+import atexit
 import json
+import hashlib
+import io
+import queue
 import re
+import threading
+import time
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from itertools import accumulate
 import requests
 from datetime import datetime, UTC
 from pathlib import Path
 import sys
 from dotenv import load_dotenv
+try:
+    import orjson  # optional, C-accelerated JSON for the streaming hot path
+except Exception:  # pragma: no cover
+    orjson = None
+
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+def _json_bytes(obj, indent=False) -> bytes:
+    """Serialize to UTF-8 JSON bytes (non-ASCII kept as-is)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode("utf-8")
+
+def _jsonl_bytes(rows) -> bytes:
+    return b"".join(_json_bytes(row) + b"\n" for row in rows)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -29,7 +53,7 @@ POLICY_PATH   = CHAT_CORE_DIR / "policy.json"
 # Point to colocated KB next to retriever (backend/chat_core/kb), do not create workdir/kb
 KB_DIR = CHAT_CORE_DIR / "kb"
 
-# in-memory index of chunks: [{ "text": "...", "source": "file.md" }, ...]
+# in-memory index of chunks: [{ "text": "...", "source": "file.md", "tokens": Counter }, ...]
 KB_INDEX = []
 LAST_SOURCES = []
 
@@ -64,27 +88,30 @@ def _index_kb():
         except Exception:
             continue
         for ch in _chunk_text(txt):
-            KB_INDEX.append({"text": ch, "source": f.name})
+            # term counts are computed once here instead of per query
+            tokens = Counter(_WORD_RE.findall(ch.lower()))
+            KB_INDEX.append({"text": ch, "source": f.name, "tokens": tokens})
     return len(KB_INDEX)
 
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
 _STOP = set("""a an and are as at be by for from has have in is it its of on or that the this to was were will with you your""".split())
 
-def _score_chunk(query, chunk):
-    q = [w for w in re.findall(r"[A-Za-z0-9]+", query.lower()) if w not in _STOP]
-    if not q:
-        return 0
-    c = chunk.lower()
-    score = 0
-    for w in q:
-        # simple term frequency
-        score += c.count(w)
-    return score
+def _query_terms(query):
+    return [w for w in _WORD_RE.findall(query.lower()) if w not in _STOP]
+
+def _score_chunk(q_terms, entry):
+    # simple term frequency over the chunk's cached token counts
+    tokens = entry["tokens"]
+    return sum(tokens[w] for w in q_terms)
 
 def _rag_query_local(query: str, top_k: int = 4):
     if not KB_INDEX:
         _index_kb()
+    q_terms = _query_terms(query)
+    if not q_terms:
+        return []
     scored = [
-        (entry["text"], _score_chunk(query, entry["text"]))
+        (entry["text"], _score_chunk(q_terms, entry))
         for entry in KB_INDEX
     ]
     scored = [s for s in scored if s[1] > 0]
@@ -94,6 +121,9 @@ def _rag_query_local(query: str, top_k: int = 4):
 # ---------- Server / Model ----------
 LLAMA_URL   = os.environ.get("LLAMA_URL", "http://127.0.0.1:8080/v1/chat/completions")
 LLAMA_MODEL = os.environ.get("LLAMA_MODEL", "qwen2.5-3b-instruct-q4_k_m")  # label only
+# llama.cpp's cache_prompt is not an OpenAI field and strict servers reject
+# it, so it is only sent when LLAMA_PREFIX_CACHE=1 (llama-server backends)
+LLAMA_PREFIX_CACHE = os.environ.get("LLAMA_PREFIX_CACHE", "0").lower() in ("1", "true", "yes")
 
 RETRIEVER = None
 def get_retriever():
@@ -107,17 +137,21 @@ def get_retriever():
             RETRIEVER = False  # mark unavailable
     return RETRIEVER
 
+# whole instruction-like lines (leading blanks allowed), including their newline
+_SANITIZE_RE = re.compile(
+    r"^[^\S\n]*(?:ignore previous instructions|system:|assistant:).*(?:\n|$)",
+    re.IGNORECASE | re.MULTILINE,
+)
+
 def _sanitize_chunk_text(text: str) -> str:
     # Strip instruction-like lines defensively
-    lines = []
-    for line in (text or "").splitlines():
-        line_stripped = line.strip()
-        if re.match(r"(?i)^(ignore previous instructions|system:|assistant:)", line_stripped):
-            continue
-        lines.append(line)
-    return "\n".join(lines).strip()
+    return _SANITIZE_RE.sub("", text or "").strip()
 
-def build_context_block(user_query: str) -> str:
+_BLOCK_FMT = "\n---\nSource: {src} (title: {title})\n{snippet}\n"
+_BLOCK_OVERHEAD = len(_BLOCK_FMT.format(src="", title="", snippet=""))
+
+def build_context_block(user_query: str, embedding=None) -> str:
+    # embedding: the query's retr.embed() vector when the caller already has it
     top_k = int(config.get("rag_top_k", 4))
     max_chars = int(config.get("rag_max_chars", 1800))
 
@@ -126,21 +160,33 @@ def build_context_block(user_query: str) -> str:
     ranked = []
     if retr:
         try:
-            ranked = retr.search(user_query)  # each has text, doc, chunk_id, id, maybe title
+            ranked = retr.search(user_query, embedding=embedding)  # each has text, doc, chunk_id, id, maybe title
         except Exception:
             ranked = []
     if not ranked:
-        # Fallback to local TF ranking over text files
-        if not KB_INDEX:
-            _index_kb()
-        ranked = sorted(
-            KB_INDEX,
-            key=lambda ch: _score_chunk(user_query, ch["text"]),
-            reverse=True
-        )[:top_k]
-
+        ranked = _local_ranked(user_query, top_k)
     if not ranked:
         return ""
+    context, srcs = _pack_context(ranked, top_k, max_chars)
+    global LAST_SOURCES
+    LAST_SOURCES = srcs
+    return context
+
+def _local_ranked(user_query, top_k):
+    # Fallback to local TF ranking over text files
+    if not KB_INDEX:
+        _index_kb()
+    q_terms = _query_terms(user_query)
+    return sorted(
+        KB_INDEX,
+        key=lambda ch: _score_chunk(q_terms, ch),
+        reverse=True
+    )[:top_k]
+
+def _pack_context(ranked, top_k, max_chars):
+    """(context block, source titles) for ranked chunks; ("", []) if none."""
+    if not ranked:
+        return "", []
 
     # pack context with source attributions
     out_lines = [
@@ -149,23 +195,263 @@ def build_context_block(user_query: str) -> str:
         "If the answer is not in the context, say “I don’t know from the provided documents.”",
         "Cite the snippet titles you used in parentheses.",
     ]
-    used = 0
-    srcs = []
+    parts = []
     for r in ranked[:top_k]:
         # unify metadata field names between retriever and fallback
         src = r.get("doc") or r.get("source") or "(unknown)"
         snippet = _sanitize_chunk_text(r.get("text", "").strip())
         title = r.get("title") or Path(src).name
-        block = f"\n---\nSource: {src} (title: {title})\n{snippet}\n"
-        if used + len(block) > max_chars:
-            break
-        out_lines.append(block)
-        used += len(block)
+        parts.append((src, title, snippet))
+    # greedy prefix that fits max_chars, measured before any block is formatted
+    sizes = accumulate(_BLOCK_OVERHEAD + len(src) + len(title) + len(snippet)
+                       for src, title, snippet in parts)
+    n_fit = bisect_right(list(sizes), max_chars)
+    srcs = []
+    for src, title, snippet in parts[:n_fit]:
+        out_lines.append(_BLOCK_FMT.format(src=src, title=title, snippet=snippet))
         if title not in srcs:
             srcs.append(title)
+    return "\n".join(out_lines).strip(), srcs
+
+# ---------- RAG context cache ----------
+class SmartRAGCache:
+    """LRU + TTL cache of built context blocks keyed by the normalized query.
+
+    Entries are (context, sources, ts, size); the oldest are evicted once
+    the total size passes `max_bytes`.
+    """
+
+    def __init__(self, ttl_s=600.0, max_bytes=100 * 1024 * 1024):
+        self.ttl_s = float(ttl_s)
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query):
+        # whitespace/case-insensitive; retrieval knobs are part of the key
+        norm = " ".join((query or "").lower().split())
+        raw = f"{norm}|{config.get('rag_top_k', 4)}|{config.get('rag_max_chars', 1800)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return (context, sources) or None."""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[2] > self.ttl_s:
+            self._drop(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0], list(entry[1])
+
+    def put(self, key, context, sources):
+        if key in self._entries:
+            self._drop(key)
+        size = len(context.encode("utf-8")) + sum(len(s) for s in sources)
+        if size <= self.max_bytes:
+            self._entries[key] = (context, list(sources), time.monotonic(), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+        return context, list(sources)
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[3]
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl_s": self.ttl_s,
+        }
+
+class LSHQueryIndex:
+    """Random-hyperplane LSH over query embeddings for near-duplicate lookup.
+
+    `n_tables` tables of `n_bits`-bit signatures map bucket -> cache keys;
+    candidates from all tables are re-ranked by cosine similarity. The
+    projection planes are saved to `path` so buckets survive restarts.
+    """
+
+    def __init__(self, path, n_bits=16, n_tables=8, seed=0):
+        self.path = path
+        self.n_bits = int(n_bits)
+        self.n_tables = int(n_tables)
+        self.seed = seed
+        self._planes = None
+        self._tables = [{} for _ in range(self.n_tables)]
+        self._embs = {}  # cache key -> (embedding, tag)
+
+    def _get_planes(self, dim):
+        import numpy as np
+        if self._planes is None:
+            shape = (self.n_tables, self.n_bits, dim)
+            planes = None
+            try:
+                planes = np.load(self.path)
+                if planes.shape != shape:
+                    planes = None
+            except Exception:
+                planes = None
+            if planes is None:
+                planes = np.random.default_rng(self.seed).standard_normal(shape).astype(np.float32)
+                try:
+                    np.save(self.path, planes)
+                except Exception:
+                    pass
+            self._planes = planes
+        return self._planes
+
+    def _codes(self, emb):
+        import numpy as np
+        bits = (self._get_planes(emb.shape[0]) @ emb) > 0  # (n_tables, n_bits)
+        return [row.tobytes() for row in np.packbits(bits, axis=1)]
+
+    def add(self, key, emb, tag=None):
+        for table, code in zip(self._tables, self._codes(emb)):
+            table.setdefault(code, []).append(key)
+        self._embs[key] = (emb, tag)
+
+    def nearest(self, emb, threshold, tag=None, alive=None):
+        """Return the most similar stored key with cosine >= threshold, or None."""
+        import numpy as np
+        cands = []
+        seen = set()
+        for table, code in zip(self._tables, self._codes(emb)):
+            for key in table.get(code, ()):
+                if key in seen or self._embs[key][1] != tag or (alive and not alive(key)):
+                    continue
+                seen.add(key)
+                cands.append(key)
+        if not cands:
+            return None
+        sims = np.stack([self._embs[k][0] for k in cands]) @ emb
+        best = int(np.argmax(sims))
+        return cands[best] if sims[best] >= threshold else None
+
+    def prune(self, alive):
+        """Forget keys for which alive(key) is false."""
+        dead = [k for k in self._embs if not alive(k)]
+        if not dead:
+            return
+        dead = set(dead)
+        for k in dead:
+            del self._embs[k]
+        for table in self._tables:
+            for code in list(table):
+                keys = [k for k in table[code] if k not in dead]
+                if keys:
+                    table[code] = keys
+                else:
+                    del table[code]
+
+    def __len__(self):
+        return len(self._embs)
+
+    def clear(self):
+        self._tables = [{} for _ in range(self.n_tables)]
+        self._embs.clear()
+
+RAG_CACHE = SmartRAGCache(
+    ttl_s=float(os.environ.get("RAG_CACHE_TTL", 600)),
+    max_bytes=int(os.environ.get("RAG_CACHE_MB", 100)) * 1024 * 1024,
+)
+
+# near-duplicate layer; needs the FAISS retriever's embedder
+RAG_LSH = LSHQueryIndex(WORKDIR / "rag_lsh_planes.npy")
+
+def _query_embedding(query):
+    retr = get_retriever()
+    if not retr or not config.get("rag_cache_semantic", True):
+        return None
+    try:
+        return retr.embed(query)
+    except Exception:
+        return None
+
+def cached_context_block(user_query: str) -> str:
+    """build_context_block() behind RAG_CACHE; keeps LAST_SOURCES in sync.
+
+    Exact (normalized) repeats hit first; otherwise paraphrases whose
+    embedding is within rag_cache_sim_threshold cosine of a cached query
+    reuse that query's context.
+    """
     global LAST_SOURCES
-    LAST_SOURCES = srcs
-    return "\n".join(out_lines).strip()
+    key = RAG_CACHE.key(user_query)
+    hit = RAG_CACHE.get(key)
+    emb = None
+    tag = (config.get("rag_top_k", 4), config.get("rag_max_chars", 1800))
+    if hit is None:
+        emb = _query_embedding(user_query)
+        if emb is not None:
+            near = RAG_LSH.nearest(emb, float(config.get("rag_cache_sim_threshold", 0.95)),
+                                   tag=tag, alive=RAG_CACHE.__contains__)
+            if near is not None:
+                hit = RAG_CACHE.get(near)
+    if hit is not None:
+        context, LAST_SOURCES = hit
+        return context
+    context = build_context_block(user_query, embedding=emb)  # no second encode
+    RAG_CACHE.put(key, context, LAST_SOURCES)
+    if emb is not None:
+        if len(RAG_LSH) > 2 * len(RAG_CACHE) + 64:
+            RAG_LSH.prune(RAG_CACHE.__contains__)
+        RAG_LSH.add(key, emb, tag=tag)
+    return context
+
+def warm_rag_cache(queries):
+    """Prefill RAG_CACHE (and RAG_LSH) for many queries at once.
+
+    Uncached queries are embedded in one batch and searched with one FAISS
+    call instead of one retrieval per query. Returns how many were added.
+    """
+    top_k = int(config.get("rag_top_k", 4))
+    max_chars = int(config.get("rag_max_chars", 1800))
+    tag = (config.get("rag_top_k", 4), config.get("rag_max_chars", 1800))
+    todo = {}
+    for q in queries:
+        q = (q or "").strip()
+        if q:
+            key = RAG_CACHE.key(q)
+            if key not in RAG_CACHE:
+                todo.setdefault(key, q)
+    if not todo:
+        return 0
+    keys, qs = list(todo), list(todo.values())
+
+    retr = get_retriever()
+    embs, ranked_lists = None, [[] for _ in qs]
+    if retr:
+        try:
+            embs = retr.embed_batch(qs)
+            ranked_lists = retr.search_batch(qs, top_k=top_k, embeddings=embs)
+        except Exception:
+            embs, ranked_lists = None, [[] for _ in qs]
+    semantic = embs is not None and config.get("rag_cache_semantic", True)
+
+    for i, (key, q) in enumerate(zip(keys, qs)):
+        context, srcs = _pack_context(ranked_lists[i] or _local_ranked(q, top_k), top_k, max_chars)
+        RAG_CACHE.put(key, context, srcs)
+        if semantic:
+            RAG_LSH.add(key, embs[i], tag=tag)
+    return len(keys)
 
 # ---------- Persistence helpers ----------
 def _read_json(path, default):
@@ -177,20 +463,58 @@ def _read_json(path, default):
         pass
     return default
 
-def _write_json(path, data):
+def _write_bytes_atomic(path, buf):
     tmp = path.with_suffix(path.suffix + ".tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    tmp.write_bytes(buf)
     tmp.replace(path)
 
+def _write_json(path, data):
+    _write_bytes_atomic(path, _json_bytes(data, indent=True))
+
+class _LazyJSON:
+    """Dict stand-in that reads its JSON file on first use, not at import."""
+    __slots__ = ("_path", "_default", "_data")
+
+    def __init__(self, path, default):
+        self._path = path
+        self._default = default
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            self._data = _read_json(self._path, self._default)
+        return self._data
+
+    # get/update/clear/items/keys/... all come from the loaded dict
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __repr__(self):
+        return repr(self._load())
+
 # identity
-identity = _read_json(IDENTITY_PATH, {
+identity = _LazyJSON(IDENTITY_PATH, {
     "instance_name": "AegisMind",
     "custodian": "Operator"
 })
 
 # config (runtime prefs)
-config = _read_json(CONFIG_PATH, {
+config = _LazyJSON(CONFIG_PATH, {
     "temperature": 0.2,
     "top_p": 0.95,
     "max_tokens": 256,
@@ -214,16 +538,21 @@ config = _read_json(CONFIG_PATH, {
 })
 
 # memory (simple fact store)
-memory = _read_json(MEMORY_PATH, { "facts": [] })
+memory = _LazyJSON(MEMORY_PATH, { "facts": [] })
 
 def save_identity():
-    _write_json(IDENTITY_PATH, identity)
+    _write_json(IDENTITY_PATH, dict(identity))
 
 def save_config():
-    _write_json(CONFIG_PATH, config)
+    _write_json(CONFIG_PATH, dict(config))
+
+# bumped on every memory write so cached preambles know when to rebuild
+_MEM_VER = 0
 
 def save_memory():
-    _write_json(MEMORY_PATH, memory)
+    global _MEM_VER
+    _MEM_VER += 1
+    _write_json(MEMORY_PATH, dict(memory))
 
 # ---------- Policy (Guardian rules) ----------
 DEFAULT_POLICY = {
@@ -255,8 +584,8 @@ DEFAULT_POLICY = {
     "soft_rules": []
 }
 
-policy = _read_json(POLICY_PATH, DEFAULT_POLICY)
-def save_policy(): _write_json(POLICY_PATH, policy)
+policy = _LazyJSON(POLICY_PATH, DEFAULT_POLICY)
+def save_policy(): _write_json(POLICY_PATH, dict(policy))
 
 def _matches_any(text, needles):
     t = text or ""
@@ -311,67 +640,110 @@ def guardian_caps_clamp(temp_req, max_tokens_req):
     return min(t_eff, t_cap), min(m_eff, m_cap)
 
 # ---------- RAG query classifier ----------
-def is_info_query(text: str) -> bool:
-    if not text:
-        return False
-    t = text.strip().lower()
+_WH_WORDS = ("what","who","when","where","why","how","which","whom","whose")
+_WH_PREFIXES = tuple(w + " " for w in _WH_WORDS)
+
+def _compile_rag_triggers(triggers):
+    # one alternation: '?' anywhere, WH word at the start, or any trigger term
+    parts = [r"(?P<q>\?)", r"(?P<wh>^(?:" + "|".join(_WH_WORDS) + r") )"]
+    terms = [re.escape(k) for k in triggers if k]
+    if terms:
+        parts.append("(?P<trig>" + "|".join(terms) + ")")
+    return re.compile("|".join(parts), re.IGNORECASE)
+
+_RAG_TRIGGER_RE = None  # compiled on first use (config loads lazily)
+
+def _refresh_rag_triggers():
+    """Recompile the trigger regex after auto_rag_triggers changes."""
+    global _RAG_TRIGGER_RE
+    _RAG_TRIGGER_RE = _compile_rag_triggers(config.get("auto_rag_triggers", []))
+
+def _classify(text):
+    """Return (would_trigger: bool, reason: str) for a user message."""
+    t = (text or "").strip()
+    if not t:
+        return False, "empty input"
+    if t.startswith("/"):  # commands never use RAG
+        return False, "suppressed (command)"
+    min_len = int(config.get("auto_rag_min_len", 12))
+    if len(t) < min_len:
+        return False, f"suppressed (shorter than min_len={min_len})"
+    # reasons follow the verdict's priority ('?', WH word, trigger), as in
+    # is_info_query, not whichever alternative the regex finds first
+    if "?" in t:
+        return True, "contains '?'"
+    if t.lower().startswith(_WH_PREFIXES):
+        return True, "starts with WH word"
+    if _RAG_TRIGGER_RE is None:
+        _refresh_rag_triggers()
+    m = _RAG_TRIGGER_RE.search(t)
+    if m is None:
+        return False, "no triggers matched"
+    return True, f"matched trigger '{m.group().lower()}'"
 
-    # quick exits
-    if len(t) < int(config.get("auto_rag_min_len", 12)):
-        return False
-    if any(t.startswith(cmd) for cmd in ("/",)):  # commands never use RAG
+def is_info_query(text: str) -> bool:
+    # same verdict as _classify() without building the reason string;
+    # a plain '?' scan settles the common case before the regex runs
+    t = (text or "").strip()
+    if not t or t[0] == "/" or len(t) < int(config.get("auto_rag_min_len", 12)):
         return False
-
-    # obvious questions
     if "?" in t:
         return True
-
-    # wh-words and trigger terms
-    wh = {"what","who","when","where","why","how","which","whom","whose"}
-    if any(t.startswith(w + " ") for w in wh):
-        return True
-
-    triggers = set(config.get("auto_rag_triggers", []))
-    if any(k in t for k in triggers):
-        return True
-
-    return False
+    if _RAG_TRIGGER_RE is None:
+        _refresh_rag_triggers()
+    return _RAG_TRIGGER_RE.search(t) is not None
 
 def explain_info_query(text: str):
     """Return (bool, reason_string) for /ragwhy."""
-    if not text or not text.strip():
-        return False, "empty input"
-    t = text.strip().lower()
-    if any(t.startswith(cmd) for cmd in ("/",)):
-        return False, "suppressed (command)"
-    if len(t) < int(config.get("auto_rag_min_len", 12)):
-        return False, f"suppressed (shorter than min_len={config.get('auto_rag_min_len',12)})"
-    if "?" in t:
-        return True, "contains '?'"
-    wh = {"what","who","when","where","why","how","which","whom","whose"}
-    if any(t.startswith(w + " ") for w in wh):
-        return True, "starts with WH word"
-    for trig in config.get("auto_rag_triggers", []):
-        if trig in t:
-            return True, f"matched trigger '{trig}'"
-    return False, "no triggers matched"
+    return _classify(text)
 
 # ---------- System message ----------
+# (key, text) of the last build; preambles only change with identity/memory/day
+_MEM_PREAMBLE = (None, "")
+_SYS_PREAMBLE = (None, "")
+
+# today's UTC date string and the epoch second at which it expires
+_DAY_STR = ""
+_DAY_BOUNDARY_TS = 0.0
+
+def _utc_day():
+    """Return today's UTC date (YYYY-MM-DD), reformatted only after midnight."""
+    global _DAY_STR, _DAY_BOUNDARY_TS
+    now = time.time()
+    if now >= _DAY_BOUNDARY_TS:
+        _DAY_STR = time.strftime("%Y-%m-%d", time.gmtime(now))
+        _DAY_BOUNDARY_TS = (now // 86400 + 1) * 86400
+    return _DAY_STR
+
 def memory_preamble():
+    global _MEM_PREAMBLE
+    if _MEM_PREAMBLE[0] == _MEM_VER:
+        return _MEM_PREAMBLE[1]
     if not memory["facts"]:
-        return ""
-    bullets = "\n".join(f"- {fact}" for fact in memory["facts"][:20])
-    return f"\nKnown facts about the user and session:\n{bullets}\n"
+        text = ""
+    else:
+        bullets = "\n".join(f"- {fact}" for fact in memory["facts"][:20])
+        text = f"\nKnown facts about the user and session:\n{bullets}\n"
+    _MEM_PREAMBLE = (_MEM_VER, text)
+    return text
 
 def system_preamble():
-    today = datetime.now(UTC).strftime("%Y-%m-%d")
+    global _SYS_PREAMBLE
+    today = _utc_day()
+    name = identity.get('instance_name','AegisMind')
+    custodian = identity.get('custodian','Operator')
+    key = (name, custodian, _MEM_VER, today)
+    if _SYS_PREAMBLE[0] == key:
+        return _SYS_PREAMBLE[1]
     base = (
-        f"You are {identity.get('instance_name','AegisMind')}. "
-        f"You are restored by {identity.get('custodian','Operator')}. "
+        f"You are {name}. "
+        f"You are restored by {custodian}. "
         f"Be concise, clear, and safe. If asked for secrets, refuse. "
         f"Today is {today} UTC."
     )
-    return base + memory_preamble()
+    text = base + memory_preamble()
+    _SYS_PREAMBLE = (key, text)
+    return text
 
 # ---------- Chat history ----------
 def load_history_last():
@@ -388,66 +760,115 @@ def load_history_last():
         hist = []
     return hist
 
-def save_history_last(hist):
+def _save_history_now(hist):
     try:
-        with HISTORY_LAST.open("w", encoding="utf-8") as f:
-            for turn in hist:
-                f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+        _write_bytes_atomic(HISTORY_LAST, _jsonl_bytes(hist))
     except Exception:
         pass
 
+# history writes happen on a background thread; the single-slot queue
+# holds only the newest snapshot, so rapid turns coalesce into one write
+HIST_Q = queue.Queue(maxsize=1)
+_HIST_WRITER = None
+
+def _history_writer():
+    while True:
+        snap = HIST_Q.get()
+        try:
+            _save_history_now(snap)
+        finally:
+            HIST_Q.task_done()
+
+def save_history_last(hist):
+    global _HIST_WRITER
+    if _HIST_WRITER is None:
+        _HIST_WRITER = threading.Thread(target=_history_writer, name="history-writer", daemon=True)
+        _HIST_WRITER.start()
+    snap = [dict(m) for m in hist]  # the loop keeps mutating `history`
+    while True:
+        try:
+            HIST_Q.put_nowait(snap)
+            return
+        except queue.Full:
+            try:
+                HIST_Q.get_nowait()  # last write wins
+                HIST_Q.task_done()
+            except queue.Empty:
+                pass
+
+def commit_history():
+    """Block until the newest queued history snapshot is on disk."""
+    if _HIST_WRITER is not None:
+        HIST_Q.join()
+
+atexit.register(commit_history)
+
 # ---------- Export helpers ----------
-def _format_md(hist):
-    out = []
+def _md_turns(hist):
+    name = identity.get('instance_name','Assistant')
     for t in hist:
         role = t["role"].capitalize()
+        content = t['content'].strip()
         if role == "System":
-            out.append(f"**System**:\n> {t['content'].strip()}\n")
+            yield f"**System**:\n> {content}"
         elif role == "User":
-            out.append(f"**You**:\n{t['content'].strip()}\n")
+            yield f"**You**:\n{content}"
         else:
-            out.append(f"**{identity.get('instance_name','Assistant')}**:\n{t['content'].strip()}\n")
-    return "\n".join(out).strip() + "\n"
+            yield f"**{name}**:\n{content}"
 
-def _format_txt(hist):
-    out = []
+def _txt_turns(hist):
     for t in hist:
-        out.append(f"{t['role']}: {t['content'].strip()}")
-    return "\n\n".join(out) + "\n"
+        yield f"{t['role']}: {t['content'].strip()}"
+
+_FORMATTERS = {"md": _md_turns, "txt": _txt_turns}
+
+def export_transcript_stream(hist, fmt, path):
+    """Write turns one by one through a 64 KiB buffer; returns bytes written."""
+    n = 0
+    with open(path, "wb", buffering=1 << 16) as f:
+        sep = b""
+        for turn in _FORMATTERS[fmt](hist):
+            n += f.write(sep + turn.encode("utf-8"))
+            sep = b"\n\n"
+        n += f.write(b"\n")
+    return n
 
 def export_transcript(hist, fmt="md"):
+    """Export to WORKDIR; returns (path, bytes written) or (None, 0)."""
     ts = datetime.now(UTC).strftime("%Y%m%d-%H%M%S")
     title = config.get("session_title", "").strip()
     suffix = f"_{title}" if title else ""
     ext = "md" if fmt == "md" else "txt"
     path = WORKDIR / f"chat{suffix}_{ts}.{ext}"
     try:
-        text = _format_md(hist) if fmt == "md" else _format_txt(hist)
-        with path.open("w", encoding="utf-8") as f:
-            f.write(text)
-        return str(path)
+        return str(path), export_transcript_stream(hist, ext, path)
     except Exception:
-        return None
+        return None, 0
+
+# Chat history; filled by _init_history() when the CLI starts
+history = []
 
-# Initialize history (optionally resume)
-if config.get("auto_resume", True):
-    history = load_history_last()
-    if not history or history[0].get("role") != "system":
-        history = [{"role": "system", "content": system_preamble()}]
-else:
-    history = [{"role": "system", "content": system_preamble()}]
+def _init_history():
+    """Resume the last session (if auto_resume) or start a fresh one."""
+    hist = load_history_last() if config.get("auto_resume", True) else []
+    if not hist or hist[0].get("role") != "system":
+        hist = [{"role": "system", "content": system_preamble()}]
+    history[:] = hist
 
 # ---------- API helpers ----------
+_ROLES = frozenset(("system", "user", "assistant"))
+
 def build_messages(hist):
-    msgs = []
-    for t in hist:
-        role = t.get("role", "assistant")
-        if role not in ("system", "user", "assistant"):
-            role = "assistant"
-        msgs.append({"role": role, "content": t.get("content","")})
-    return msgs
+    # unknown roles are sent as assistant turns
+    return [
+        {"role": r if (r := t.get("role", "assistant")) in _ROLES else "assistant",
+         "content": t.get("content","")}
+        for t in hist
+    ]
 
 def stream_chat(messages, max_tokens=None, temp=None, top_p=None):
+    """Stream reply tokens. The system preamble (plus the RAG context when
+    present) leads `messages`, so llama-server's cache_prompt can reuse it."""
     t_eff, m_eff = guardian_caps_clamp(temp, max_tokens)
     payload = {
         "model": LLAMA_MODEL,
@@ -457,22 +878,52 @@ def stream_chat(messages, max_tokens=None, temp=None, top_p=None):
         "max_tokens": m_eff,
         "stream": True,
     }
+    if LLAMA_PREFIX_CACHE:
+        # llama-server reuses the KV cache of a matching prompt prefix
+        payload["cache_prompt"] = True
     with requests.post(LLAMA_URL, json=payload, stream=True, timeout=600) as r:
         r.raise_for_status()
-        for line in r.iter_lines(decode_unicode=True):
-            if not line or not line.startswith("data: "):
-                continue
-            data = line[6:].strip()
-            if data == "[DONE]":
+        for data in _iter_sse_data(r):
+            if data == b"[DONE]":
                 break
             try:
-                obj = json.loads(data)
-                delta = obj.get("choices", [{}])[0].get("delta", {})
-                chunk = delta.get("content", "")
-                if chunk:
-                    yield chunk
-            except json.JSONDecodeError:
-                yield line
+                chunk = _json_loads(data)["choices"][0]["delta"]["content"]
+            except (KeyError, IndexError, TypeError):
+                continue
+            except ValueError:
+                # not JSON: pass the raw payload through, as before
+                yield data.decode("utf-8", errors="replace")
+                continue
+            if chunk:
+                yield chunk
+
+def _iter_sse_data(resp, chunk_size=4096):
+    """Yield the payload (bytes) of every `data:` line in an SSE response.
+
+    Reads whatever the socket has available (read1) into a bytearray and
+    splits on newlines without decoding, so each token costs one slice and
+    one JSON parse instead of a UTF-8 decode + str strip per line.
+    """
+    read1 = getattr(resp.raw, "read1", None)
+    if read1 is not None:
+        blocks = iter(lambda: read1(chunk_size, decode_content=True), b"")
+    else:
+        blocks = resp.iter_content(chunk_size=None)
+    buf = bytearray()
+    for block in blocks:
+        buf += block
+        start = 0
+        while True:
+            end = buf.find(b"\n", start)
+            if end < 0:
+                break
+            line = buf[start:end]
+            start = end + 1
+            if line.startswith(b"data:"):
+                yield bytes(line[5:].strip())
+        del buf[:start]
+    if buf.startswith(b"data:"):
+        yield bytes(buf[5:].strip())
 
 # ---------- Memory: tiny “auto-learn” heuristic ----------
 FACT_PATTERNS = [
@@ -567,7 +1018,7 @@ def show_help():
     print(
         "Commands: /reset, /save, /config, /id, /mem, /policy, /guardian, /kb, /rag, /ragwhy, /export, /title, /help, /exit\n"
         "/config                -> show config\n"
-        "/config set key value  -> set config key (temperature|top_p|max_tokens|auto_resume|auto_mem|auto_rag|auto_rag_min_len|rag_top_k|rag_max_chars|guard_refusal_text|rag_show_sources)\n"
+        "/config set key value  -> set config key (temperature|top_p|max_tokens|auto_resume|auto_mem|auto_rag|auto_rag_min_len|rag_top_k|rag_max_chars|guard_refusal_text|rag_show_sources|rag_cache_semantic|rag_cache_sim_threshold|persist_blocked)\n"
         "/id                    -> show identity\n"
         "/id set instance <name> / custodian <name>\n"
         "/mem                   -> show memory facts\n"
@@ -580,18 +1031,19 @@ def show_help():
         "/kb                    -> kb stats; /kb reload to re-index; /kb ragstats for FAISS/emb stats\n"
         "/rag                   -> show RAG status; /rag on|off; /rag minlen N; /rag triggers a,b,c\n"
         "/ragwhy <text>         -> explain if RAG would trigger and why\n"
+        "/ragwarm <file>        -> prefill the RAG cache with one query per line\n"
         "/export md|txt         -> export pretty transcript\n"
         "/title <text>          -> set session title (used in export filename)\n"
     )
 
 def cmd_config(args):
     if not args:
-        print(json.dumps(config, indent=2))
+        print(json.dumps(dict(config), indent=2))
         return
     if args[0] == "set" and len(args) >= 3:
         key = args[1]
         val = " ".join(args[2:])
-        if key in ("temperature", "top_p"):
+        if key in ("temperature", "top_p", "rag_cache_sim_threshold"):
             try:
                 config[key] = float(val)
             except ValueError:
@@ -603,12 +1055,13 @@ def cmd_config(args):
             except ValueError:
                 print("Must be an integer.")
                 return
-        elif key in ("auto_resume", "auto_mem", "auto_rag", "guardian_enabled", "rag_show_sources"):
+        elif key in ("auto_resume", "auto_mem", "auto_rag", "guardian_enabled", "rag_show_sources", "rag_cache_semantic", "persist_blocked"):
             config[key] = val.lower() in ("1", "true", "yes", "on")
         elif key == "auto_rag_triggers":
             # comma-separated list -> list[str]
             triggers = [s.strip().lower() for s in val.split(",") if s.strip()]
             config[key] = triggers
+            _refresh_rag_triggers()
         elif key == "guard_refusal_text":
             config[key] = val
         else:
@@ -621,7 +1074,7 @@ def cmd_config(args):
 
 def cmd_id(args):
     if not args:
-        print(json.dumps(identity, indent=2))
+        print(json.dumps(dict(identity), indent=2))
         return
     if args[0] == "set" and len(args) >= 3:
         field = args[1]
@@ -678,7 +1131,7 @@ def cmd_mem(args):
 
 def cmd_policy(args):
     if not args:
-        print(json.dumps(policy, indent=2))
+        print(json.dumps(dict(policy), indent=2))
         return
     if args[0].lower() == "reload":
         # reload from disk (fallback to defaults if missing/broken)
@@ -706,9 +1159,7 @@ def save_transcript(hist):
     ts = datetime.now(UTC).strftime("%Y%m%d-%H%M%S")
     path = WORKDIR / f"chat_{ts}.jsonl"
     try:
-        with path.open("w", encoding="utf-8") as f:
-            for turn in hist:
-                f.write(json.dumps(turn, ensure_ascii=False) + "\n")
+        path.write_bytes(_jsonl_bytes(hist))
         return str(path)
     except Exception:
         return None
@@ -722,6 +1173,8 @@ def cmd_kb(args):
     sub = args[0].lower()
     if sub == "reload":
         n = _index_kb()
+        RAG_CACHE.clear()
+        RAG_LSH.clear()
         print(f"KB reloaded. Chunks: {n}")
     elif sub == "stats":
         print(f"KB dir: {KB_DIR}")
@@ -738,9 +1191,11 @@ def cmd_kb(args):
                 "emb_model": os.environ.get("EMB_MODEL", "BAAI/bge-small-en-v1.5"),
                 "alpha": os.environ.get("RAG_ALPHA", 0.6),
                 "reranker": os.environ.get("RAG_RERANKER", ""),
+                "cache": RAG_CACHE.stats(),
             }, indent=2))
         else:
             print("Retriever not available. Only text-file fallback is active.")
+            print(json.dumps({"cache": RAG_CACHE.stats()}, indent=2))
     else:
         print("Usage: /kb reload | /kb stats")
 
@@ -770,11 +1225,25 @@ def cmd_rag(args):
     elif sub == "triggers" and len(args) >= 2:
         triggers = [s.strip().lower() for s in " ".join(args[1:]).split(",") if s.strip()]
         config["auto_rag_triggers"] = triggers
+        _refresh_rag_triggers()
         save_config()
         print("auto_rag_triggers updated.")
     else:
         print("Usage: /rag on|off | /rag minlen N | /rag triggers a,b,c")
 
+def cmd_ragwarm(args):
+    if not args:
+        print("Usage: /ragwarm <file>  (one query per line)")
+        return
+    path = Path(" ".join(args)).expanduser()
+    try:
+        queries = path.read_text(encoding="utf-8").splitlines()
+    except OSError as e:
+        print(f"Cannot read {path}: {e}")
+        return
+    n = warm_rag_cache(queries)
+    print(f"RAG cache warmed: {n} new entries ({len(RAG_CACHE)} total).")
+
 def cmd_ragwhy(args):
     text = " ".join(args).strip()
     if not text:
@@ -785,6 +1254,7 @@ def cmd_ragwhy(args):
 
 # ---------- Main loop ----------
 def main():
+    _init_history()
     print(
         f"{identity.get('instance_name','AegisMind')} (streaming) ready. Commands: /reset, /save, /config, /id, /mem, /policy, /guardian, /kb, /rag, /ragwhy, /export, /title, /exit\n"
     )
@@ -833,6 +1303,8 @@ def main():
                 cmd_rag(args)
             elif cmd == "/ragwhy":
                 cmd_ragwhy(args)
+            elif cmd == "/ragwarm":
+                cmd_ragwarm(args)
             elif cmd == "/ragtest":
                 query = " ".join(args).strip()
                 if not query:
@@ -866,8 +1338,8 @@ def main():
                 if not args or args[0] not in {"md","txt"}:
                     print("Usage: /export md|txt")
                 else:
-                    p = export_transcript(history, fmt=args[0])
-                    print(f"Exported -> {p}")
+                    p, nbytes = export_transcript(history, fmt=args[0])
+                    print(f"Exported -> {p} ({nbytes} bytes)" if p else "Export failed.")
             elif cmd == "/title":
                 if not args:
                     print(f"Current title: {config.get('session_title','') or '(none)'}")
@@ -884,8 +1356,10 @@ def main():
             allowed, safe_user, reason = guard_inbound(user)
             if not allowed:
                 print(f"{identity.get('instance_name','Assistant')}> {config.get('guard_refusal_text')}")
-                history.append({"role":"user","content":f"[BLOCKED by guardian] {safe_user}  (reason={reason})"})
-                save_history_last(history)
+                # persist_blocked=false keeps refused input out of history entirely
+                if config.get("persist_blocked", True):
+                    history.append({"role":"user","content":f"[BLOCKED by guardian] {safe_user}  (reason={reason})"})
+                    save_history_last(history)  # queued for the writer thread
                 continue
             user = safe_user
             # auto-learn (opt-in) after redaction
@@ -904,7 +1378,7 @@ def main():
         turn_context = ""
         context_used = False
         if config.get("auto_rag", os.environ.get("AUTO_RAG", "false").lower() in ("true", "1", "yes")) and is_info_query(user):
-            turn_context = build_context_block(user or "")
+            turn_context = cached_context_block(user or "")
             if turn_context:
                 transient = [{"role": "system", "content": turn_context}]
                 messages = build_messages([history[0]] + transient + history[1:])
@@ -918,10 +1392,16 @@ def main():
 
         print(f"{identity.get('instance_name','AegisMind')}> ", end="", flush=True)
 
-        reply_chunks = []
+        # tokens are shown as they arrive; the buffer is only for guard_outbound
+        out = sys.stdout
+        reply_buf = io.StringIO()
         try:
+            # RAG context sits right after the system preamble so the pair
+            # forms a reusable prefix
             for tok in stream_chat(messages):
-                reply_chunks.append(tok)
+                out.write(tok)
+                out.flush()
+                reply_buf.write(tok)
         except requests.HTTPError as e:
             print(f"\n[HTTP error] {e}")
             history.pop()
@@ -933,11 +1413,13 @@ def main():
             save_history_last(history)
             continue
 
-        raw_reply = "".join(reply_chunks).strip()
+        raw_reply = reply_buf.getvalue().strip()
         final_reply = guard_outbound(raw_reply) if config.get("guardian_enabled", True) else raw_reply
 
+        print()
+        if final_reply != raw_reply:
+            print("[redacted]")
         if final_reply:
-            print(final_reply)
             if context_used and config.get("rag_show_sources", True) and LAST_SOURCES:
                 print("\nSources: " + ", ".join(LAST_SOURCES))
         history.append({"role":"assistant","content":final_reply})
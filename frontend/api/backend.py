@@ -1,16 +1,109 @@
 # frontend/api/backend.py
 from __future__ import annotations
 
+import hashlib
 import json
+import os
+import threading
+from collections import OrderedDict
 from typing import Dict, Iterable, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except Exception:
+    orjson = None  # pragma: no cover
+
+try:
+    from requests_toolbelt.multipart.encoder import MultipartEncoder
+except Exception:  # optional: streamed multipart uploads
+    MultipartEncoder = None  # pragma: no cover
+
+
+# orjson on the per-token SSE path when available; both return/accept bytes
+if orjson is not None:
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+else:  # pragma: no cover
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+_JSON = {"Content-Type": "application/json"}
+# Ask intermediaries not to buffer the stream. nginx only acts on
+# X-Accel-Buffering in the *response*, so /chat/stream sends it too.
+_SSE_HEADERS = {**_JSON, "Accept": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
 
 class BackendError(RuntimeError):
     pass
 
 
+def _sse_event_data(event: bytes) -> Optional[bytes]:
+    """Joined data field of one SSE event, or None if it carries no data."""
+    data = [line[5:].strip() for line in event.split(b"\n") if line.startswith(b"data:")]
+    return b"\n".join(data) if data else None
+
+
+def _sse_frames(buffer: bytearray, chunk: bytes) -> Iterable[bytes]:
+    """Append chunk to buffer and yield (removing) every complete event."""
+    buffer += chunk
+    if b"\r" in buffer:
+        # a lone trailing \r waits for its \n in the next chunk
+        buffer[:] = buffer.replace(b"\r\n", b"\n")
+    start = 0
+    while True:
+        end = buffer.find(b"\n\n", start)
+        if end < 0:
+            break
+        yield bytes(buffer[start:end])
+        start = end + 2
+    del buffer[:start]
+
+
+def _normalize_event(data: bytes) -> Optional[Dict]:
+    """Map one SSE data payload onto {"delta": ...} / {"done": True, ...}."""
+    try:
+        evt = _loads(data)
+    except ValueError:  # json/orjson JSONDecodeError
+        return None
+    if "delta" in evt:
+        return {"delta": evt["delta"]}
+    if evt.get("done"):
+        return {"done": True, "sources": evt.get("sources", [])}
+    # best-effort
+    if "content" in evt:
+        return {"delta": evt["content"]}
+    return None
+
+
+def make_session(auth_token: Optional[str] = None) -> requests.Session:
+    """Keep-alive session for BackendClient; GETs retry on gateway errors.
+
+    Thread-safe enough to share between clients (e.g. one per server process,
+    passed to each per-user BackendClient via session=).
+    """
+    s = requests.Session()
+    # bodies are parsed from raw bytes (_loads(r.content)); gzip keeps
+    # large /rag/preview and /kb/stats payloads small on the wire
+    s.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip, deflate"})
+    if auth_token:
+        s.headers["Authorization"] = f"Bearer {auth_token}"
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,  # enough for a session shared by every app user
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504],
+                          raise_on_status=False),
+    )
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
 class BackendClient:
     """
     Thin client for your FastAPI backend.
@@ -21,38 +114,51 @@ class BackendClient:
       - POST /config              -> accepts partial config JSON to update
       - GET  /rag/preview?q=...   -> returns {"context": "...", "sources":[...]} (optional "preview")
       - POST /kb/reload           -> rebuild KB index
+      - POST /kb/reload/start     -> start a background rebuild, returns {"job_id": ...}
+      - GET  /kb/reload/{id}/events -> SSE progress {"progress": 0..1, "status": ..., "done": bool}
       - GET  /kb/stats            -> KB stats
       - POST /kb/upload           -> multipart file upload
     """
 
-    def __init__(self, base_url: str = "http://127.0.0.1:9000", *, timeout: int = 600, auth_token: Optional[str] = None):
+    def __init__(self, base_url: str = "http://127.0.0.1:9000", *, timeout: int = 600,
+                 auth_token: Optional[str] = None, session: Optional[requests.Session] = None):
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
         self.auth_token = auth_token
+        # connection pool: a shared make_session() one, or a private one.
+        # Everything below is per client (i.e. per user), never shared.
+        self._s = session if session is not None else make_session(auth_token)
+        # temperature==0 replies keyed by payload hash -> (text, sources)
+        self._replies: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._replies_max = 256
+        self._replies_lock = threading.Lock()  # stream fragment vs. main run
+        # None until the first /chat/stream answer; False after a 404 so later
+        # turns go straight to /chat instead of re-probing
+        self._stream_supported: Optional[bool] = None
 
     # ---------- helpers ----------
     def _url(self, path: str) -> str:
         path = path if path.startswith("/") else f"/{path}"
         return f"{self.base_url}{path}"
 
-    def _headers(self) -> Dict[str, str]:
-        h = {"Accept": "application/json"}
-        if self.auth_token:
-            h["Authorization"] = f"Bearer {self.auth_token}"
-        return h
+    def invalidate(self) -> None:
+        """Drop cached replies (KB, history or config changed server-side)."""
+        with self._replies_lock:
+            self._replies.clear()
 
     # ---------- config ----------
     def get_config(self) -> Dict:
-        r = requests.get(self._url("/config"), headers=self._headers(), timeout=self.timeout)
+        r = self._s.get(self._url("/config"), timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"GET /config failed: {r.status_code} {r.text}")
-        return r.json()
+        return _loads(r.content)
 
     def update_config(self, patch: Dict) -> Dict:
-        r = requests.post(self._url("/config"), headers={**self._headers(), "Content-Type": "application/json"}, data=json.dumps(patch), timeout=self.timeout)
+        r = self._s.post(self._url("/config"), headers=_JSON, data=_dumps(patch), timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"POST /config failed: {r.status_code} {r.text}")
-        return r.json()
+        self.invalidate()
+        return _loads(r.content)
 
     # ---------- chat (SSE streaming) ----------
     def chat_stream(
@@ -68,6 +174,8 @@ class BackendClient:
         Yields dict events:
            {"delta": "<text>"}  or  {"done": true, "sources": [...]}
         Falls back to non-streaming /chat if /chat/stream not available.
+        Deterministic (temperature == 0) replies are cached per client and
+        replayed as one delta + done without a backend call.
         """
         payload = {
             "messages": messages,
@@ -76,48 +184,57 @@ class BackendClient:
             "max_tokens": int(max_tokens),
             "auto_rag": bool(auto_rag),
         }
+        body = _dumps(payload)
+        if payload["temperature"] != 0.0:
+            yield from self._chat_events(body)
+            return
+
+        key = hashlib.blake2b(body, digest_size=16).digest()
+        with self._replies_lock:
+            hit = self._replies.get(key)
+            if hit is not None:
+                self._replies.move_to_end(key)
+        if hit is not None:
+            if hit[0]:
+                yield {"delta": hit[0]}
+            yield {"done": True, "sources": list(hit[1])}
+            return
+
+        parts: List[str] = []
+        for ev in self._chat_events(body):
+            if ev.get("done"):
+                with self._replies_lock:
+                    self._replies[key] = ("".join(parts), list(ev.get("sources") or []))
+                    if len(self._replies) > self._replies_max:
+                        self._replies.popitem(last=False)
+            else:
+                parts.append(ev.get("delta") or "")
+            yield ev
 
-        # Try SSE first
+    def _chat_events(self, body: bytes) -> Iterable[Dict]:
+        # Try SSE first (unless this backend already answered 404)
         try:
-            with requests.post(
+            if self._stream_supported is False:
+                raise FileNotFoundError
+            with self._s.post(
                 self._url("/chat/stream"),
-                headers={**self._headers(), "Accept": "text/event-stream", "Content-Type": "application/json"},
-                data=json.dumps(payload),
+                headers=_SSE_HEADERS,
+                data=body,
                 stream=True,
                 timeout=self.timeout,
             ) as r:
                 if r.status_code == 404:
+                    self._stream_supported = False
                     raise FileNotFoundError  # fall back below
                 r.raise_for_status()
-                buffer = ""
-                for raw in r.iter_lines(decode_unicode=True):
-                    if not raw:
-                        continue
-                    # SSE: lines like "data: {...}"
-                    if raw.startswith("data:"):
-                        data = raw[5:].strip()
-                        if data == "[DONE]":
-                            yield {"done": True, "sources": []}
-                            break
-                        try:
-                            evt = json.loads(data)
-                        except json.JSONDecodeError:
-                            # tolerate partials (rare)
-                            buffer += data
-                            try:
-                                evt = json.loads(buffer)
-                                buffer = ""
-                            except json.JSONDecodeError:
-                                continue
-                        # normalize
-                        if "delta" in evt:
-                            yield {"delta": evt["delta"]}
-                        elif evt.get("done"):
-                            yield {"done": True, "sources": evt.get("sources", [])}
-                        else:
-                            # best-effort
-                            if "content" in evt:
-                                yield {"delta": evt["content"]}
+                self._stream_supported = True
+                for data in self._iter_sse_data(r):
+                    if data == b"[DONE]":
+                        yield {"done": True, "sources": []}
+                        return
+                    ev = _normalize_event(data)
+                    if ev is not None:
+                        yield ev
                 return
         except FileNotFoundError:
             pass  # fall back
@@ -126,15 +243,15 @@ class BackendClient:
             pass
 
         # Fallback: non-streaming /chat
-        r = requests.post(
+        r = self._s.post(
             self._url("/chat"),
-            headers={**self._headers(), "Content-Type": "application/json"},
-            data=json.dumps(payload),
+            headers=_JSON,
+            data=body,
             timeout=self.timeout,
         )
         if r.status_code >= 400:
             raise BackendError(f"POST /chat failed: {r.status_code} {r.text}")
-        obj = r.json()
+        obj = _loads(r.content)
         text = obj.get("reply") or obj.get("content") or ""
         sources = obj.get("sources", [])
         # Emit one big delta + done
@@ -142,88 +259,154 @@ class BackendClient:
             yield {"delta": text}
         yield {"done": True, "sources": sources}
 
+    @staticmethod
+    def _iter_sse_data(r: requests.Response) -> Iterable[bytes]:
+        """
+        Yield the data of each SSE event as bytes (orjson parses bytes
+        directly, so nothing is decoded per token). Events end with a blank
+        line and may arrive several per network chunk or split across chunks;
+        multi-line data fields are joined with newlines as the SSE spec requires.
+        """
+        buffer = bytearray()
+        for chunk in r.iter_content(chunk_size=None):
+            if not chunk:
+                continue
+            for event in _sse_frames(buffer, chunk):
+                data = _sse_event_data(event)
+                if data is not None:
+                    yield data
+        # a final event without the trailing blank line
+        data = _sse_event_data(bytes(buffer))
+        if data is not None:
+            yield data
+
     # ---------- RAG ----------
     def rag_preview(self, q: str) -> Dict:
-        r = requests.get(self._url("/rag/preview"), params={"q": q}, headers=self._headers(), timeout=self.timeout)
+        r = self._s.get(self._url("/rag/preview"), params={"q": q}, timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"GET /rag/preview failed: {r.status_code} {r.text}")
-        return r.json()
+        return _loads(r.content)
 
     # ---------- KB ----------
     def kb_reload(self) -> Dict:
-        r = requests.post(self._url("/kb/reload"), headers=self._headers(), timeout=self.timeout)
+        r = self._s.post(self._url("/kb/reload"), timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"POST /kb/reload failed: {r.status_code} {r.text}")
-        return r.json()
+        self.invalidate()
+        return _loads(r.content)
+
+    def kb_reload_start(self) -> Optional[str]:
+        """Start a background reindex; None if the backend only has /kb/reload."""
+        r = self._s.post(self._url("/kb/reload/start"), timeout=self.timeout)
+        if r.status_code == 404:
+            return None
+        if r.status_code >= 400:
+            raise BackendError(f"POST /kb/reload/start failed: {r.status_code} {r.text}")
+        return _loads(r.content)["job_id"]
+
+    def kb_reload_stream(self, job_id: str) -> Iterable[Dict]:
+        """Yield {"progress", "status", "done", ...} events for a reindex job."""
+        with self._s.get(self._url(f"/kb/reload/{job_id}/events"), headers=_SSE_HEADERS,
+                         stream=True, timeout=self.timeout) as r:
+            if r.status_code >= 400:
+                raise BackendError(f"GET /kb/reload/{job_id}/events failed: {r.status_code} {r.text}")
+            for data in self._iter_sse_data(r):
+                try:
+                    ev = _loads(data)
+                except ValueError:
+                    continue
+                if ev.get("done"):
+                    self.invalidate()
+                yield ev
 
     def get_kb_stats(self) -> Dict:
-        r = requests.get(self._url("/kb/stats"), headers=self._headers(), timeout=self.timeout)
+        r = self._s.get(self._url("/kb/stats"), timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"GET /kb/stats failed: {r.status_code} {r.text}")
-        return r.json()
+        return _loads(r.content)
 
-    def kb_upload(self, files_payload: List[tuple]) -> Dict:
+    def kb_upload(self, files_payload: List[tuple], *, background: bool = False) -> Dict:
         """
-        files_payload format: [("files", bytes, mime, filename), ...]
+        files_payload format: [("files", content, mime, filename), ...]
+        background=True asks the backend to reindex in the background; the
+        reply then carries "job_id" (for kb_reload_stream) instead of "kb".
+        Backends without that option ignore it and reindex before replying.
+        content may be bytes, a binary file object, or a path (opened here and
+        closed afterwards). With requests-toolbelt installed the body is
+        streamed from the file objects instead of being assembled in memory.
         Backend should accept "files" as multiple form parts.
         """
-        files = []
+        opened = []
         try:
+            files = []
             for _field, content, mime, fname in files_payload:
+                if isinstance(content, (str, os.PathLike)):
+                    content = open(content, "rb")
+                    opened.append(content)
                 files.append(("files", (fname, content, mime)))
-            r = requests.post(self._url("/kb/upload"), files=files, headers=self._headers(), timeout=self.timeout)
+            params = {"background": "1"} if background else None
+            if MultipartEncoder is not None:
+                enc = MultipartEncoder(fields=files)
+                r = self._s.post(self._url("/kb/upload"), data=enc, params=params,
+                                 headers={"Content-Type": enc.content_type}, timeout=self.timeout)
+            else:
+                r = self._s.post(self._url("/kb/upload"), files=files, params=params, timeout=self.timeout)
             if r.status_code >= 400:
                 raise BackendError(f"POST /kb/upload failed: {r.status_code} {r.text}")
-            return r.json()
+            self.invalidate()
+            return _loads(r.content)
         finally:
-            for _, f in files:
-                try:
-                    f[0].close()  # content as bytes -> nothing to close, keep safe
-                except Exception:
-                    pass
+            for fh in opened:
+                fh.close()
 
     # ---------- RAG Control ----------
     def toggle_rag(self) -> Dict:
         """Toggle RAG on/off and persist to environment"""
-        r = requests.post(self._url("/rag/toggle"), headers=self._headers(), timeout=self.timeout)
+        r = self._s.post(self._url("/rag/toggle"), timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"POST /rag/toggle failed: {r.status_code} {r.text}")
-        return r.json()
+        self.invalidate()
+        return _loads(r.content)
 
     def set_rag_state(self, auto_rag: bool) -> Dict:
         """Set RAG to specific state and persist to environment"""
         payload = {"auto_rag": auto_rag}
-        r = requests.post(self._url("/rag/set"), json=payload, headers=self._headers(), timeout=self.timeout)
+        r = self._s.post(self._url("/rag/set"), headers=_JSON, data=_dumps(payload), timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"POST /rag/set failed: {r.status_code} {r.text}")
-        return r.json()
+        self.invalidate()
+        return _loads(r.content)
 
     # ---------- Guardian Control ----------
     def toggle_guardian(self) -> Dict:
         """Toggle Guardian on/off and persist to environment"""
-        r = requests.post(self._url("/guardian/toggle"), headers=self._headers(), timeout=self.timeout)
+        r = self._s.post(self._url("/guardian/toggle"), timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"POST /guardian/toggle failed: {r.status_code} {r.text}")
-        return r.json()
+        self.invalidate()
+        return _loads(r.content)
 
     def set_guardian_state(self, guardian_enabled: bool) -> Dict:
         """Set Guardian to specific state and persist to environment"""
         payload = {"guardian_enabled": guardian_enabled}
-        r = requests.post(self._url("/guardian/set"), json=payload, headers=self._headers(), timeout=self.timeout)
+        r = self._s.post(self._url("/guardian/set"), headers=_JSON, data=_dumps(payload), timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"POST /guardian/set failed: {r.status_code} {r.text}")
-        return r.json()
+        self.invalidate()
+        return _loads(r.content)
 
     def clear_knowledge_base(self) -> Dict:
         """Clear the knowledge base - remove all indexed documents"""
-        r = requests.post(self._url("/kb/clear"), headers=self._headers(), timeout=self.timeout)
+        r = self._s.post(self._url("/kb/clear"), timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"POST /kb/clear failed: {r.status_code} {r.text}")
-        return r.json()
+        self.invalidate()
+        return _loads(r.content)
 
     def clear_chat_history(self) -> Dict:
         """Clear the chat history - remove conversation context"""
-        r = requests.post(self._url("/chat/clear"), headers=self._headers(), timeout=self.timeout)
+        r = self._s.post(self._url("/chat/clear"), timeout=self.timeout)
         if r.status_code >= 400:
             raise BackendError(f"POST /chat/clear failed: {r.status_code} {r.text}")
-        return r.json()
\ No newline at end of file
+        self.invalidate()
+        return _loads(r.content)
@@ -7,9 +7,11 @@ Right: Chat history (streaming), oldest -> newest (like ChatGPT)
 
 from __future__ import annotations
 
+import html
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, List, Dict  # noqa: F401 (kept for future typing as needed)
@@ -21,9 +23,10 @@ _ROOT = Path(__file__).resolve().parents[1]
 if str(_ROOT) not in sys.path:
     sys.path.insert(0, str(_ROOT))
 
-from frontend.api.backend import BackendClient  # type: ignore  # noqa: E402
-from frontend.components.chat_interface import ChatInterface  # type: ignore  # noqa: E402
-from frontend.components.sidebar import Sidebar  # type: ignore  # noqa: E402
+from frontend.api.backend import BackendClient, make_session  # type: ignore  # noqa: E402
+from frontend.components.chat_interface import ChatInterface, _markdown_to_html_safe_impl  # type: ignore  # noqa: E402
+from frontend.components.sidebar import Sidebar, _load_config  # type: ignore  # noqa: E402
+from frontend.components.kb_reindex import register_kb_cache, reindex_progress, start_reindex, upload_and_reindex  # type: ignore  # noqa: E402
 
 
 # ---------- Page config ----------
@@ -34,9 +37,10 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-# ---------- Base CSS (sticky compose, dedicated chat pane, buttons) ----------
-st.markdown(
-    """
+# ---------- Base CSS (sticky compose, dedicated chat pane, buttons, sidebar toggle) ----------
+# Built once at import and sent as a single element per run. Streamlit drops
+# elements a rerun does not re-emit, so the style must be sent every run.
+_BASE_STYLE = """
     <style>
       .appview-container .main .block-container {
         display: flex; flex-direction: column; min-height: 100vh;
@@ -53,8 +57,13 @@ st.markdown(
         border-top: 1px solid rgba(49,51,63,.15);
         padding-top: .5rem; padding-bottom: .5rem;
       }
-      /* Right chat output scrolls independently (no markdown wrapper) */
+      /* Right chat output scrolls independently (no markdown wrapper).
+         column-reverse makes the bottom the scroll origin, so the pane
+         opens at the newest message and stays pinned while a reply grows,
+         without any JS reading scrollHeight; scrolling up still sticks. */
       [data-testid="stElementContainer"]:has(> [data-testid="stVerticalBlock"] [data-testid="stChatMessage"]) {
+        display: flex; flex-direction: column-reverse;
+        overflow-anchor: auto;
         height: calc(100vh - 220px);
         overflow-y: auto;
         padding: .5rem .25rem;
@@ -80,43 +89,38 @@ st.markdown(
       [data-testid="stChatMessageContent"] p { margin-bottom: .5rem; }
 
       /* (toolbar removed) */
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
 
-# ---------- Sidebar toggle always visible ----------
-def _ensure_sidebar_toggle_visible() -> None:
-    st.markdown(
-        """
-        <style>
-          [data-testid="collapsedControl"] { display: block !important; visibility: visible !important; opacity: 1 !important; }
-          [data-testid="collapsedControl"] button { position: fixed; left: 12px; top: 72px; z-index: 9999; }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
+      /* Sidebar toggle always visible */
+      [data-testid="collapsedControl"] { display: block !important; visibility: visible !important; opacity: 1 !important; }
+      [data-testid="collapsedControl"] button { position: fixed; left: 12px; top: 72px; z-index: 9999; }
+    </style>
+"""
+st.markdown(_BASE_STYLE, unsafe_allow_html=True)
+
+_SIDEBAR_OPEN_STYLE = """
+<style>
+  [data-testid="stSidebar"] { transform: none !important; visibility: visible !important; opacity: 1 !important; width: 18rem !important; min-width: 18rem !important; }
+  [data-testid="stSidebar"] > div { width: 18rem !important; }
+  .appview-container .main .block-container { margin-left: 18rem !important; }
+</style>
+"""
 
 def _apply_sidebar_force_open_css(force_open: bool) -> None:
-    if not force_open:
-        return
-    st.markdown(
-        """
-        <style>
-          [data-testid="stSidebar"] { transform: none !important; visibility: visible !important; opacity: 1 !important; width: 18rem !important; min-width: 18rem !important; }
-          [data-testid="stSidebar"] > div { width: 18rem !important; }
-          .appview-container .main .block-container { margin-left: 18rem !important; }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
-
-_ensure_sidebar_toggle_visible()
+    if force_open:
+        st.markdown(_SIDEBAR_OPEN_STYLE, unsafe_allow_html=True)
 
 # ---------- Session init ----------
 BACKEND_URL = os.environ.get("BACKEND_URL", "http://127.0.0.1:9000")
+
+@st.cache_resource(show_spinner=False)
+def _shared_http_session():
+    """One keep-alive pool per server process, shared by every user session."""
+    return make_session()
+
+# per-session client (its reply cache and /chat/stream memo stay per user)
+# over the shared pool
 if "backend_client" not in st.session_state:
-    st.session_state.backend_client = BackendClient(BACKEND_URL)
+    st.session_state.backend_client = BackendClient(BACKEND_URL, session=_shared_http_session())
 
 # Inject base chat CSS once and keep the helper around
 CHAT_IFACE_VERSION = "2"
@@ -131,42 +135,103 @@ if "messages" not in st.session_state:
     # [{'role': 'user'|'assistant', 'content': str, 'sources': list?}, ...]
     st.session_state.messages = []
 
-@st.cache_data(ttl=5.0)
-def _get_config_cached(url: str):
-    # cache briefly to avoid frequent network calls on every re-run
-    try:
-        return BackendClient(url).get_config()
-    except Exception:
-        return {
-            "temperature": 0.7,
-            "top_p": 0.95,
-            "max_tokens": 512,
-            "auto_rag": False,  # Default to False if backend is unavailable
-            "rag_top_k": 4,
-            "rag_max_chars": 1200,
-        }
+# Defaults when the backend is unreachable; never cached, so the real config
+# is fetched again on the next run
+_OFFLINE_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "max_tokens": 512,
+    "auto_rag": False,  # Default to False if backend is unavailable
+    "rag_top_k": 4,
+    "rag_max_chars": 1200,
+}
+
+# one config cache shared with the sidebar; every Apply/Refresh clears it
+try:
+    st.session_state.config = _load_config(st.session_state.backend_client, BACKEND_URL)
+except Exception:
+    st.session_state.config = dict(_OFFLINE_CONFIG)
+
+
+# Messages that never benefit from retrieval; anything else keeps RAG on.
+_SMALL_TALK = frozenset((
+    "ok", "okay", "k", "thanks", "thank you", "thx", "ty", "cool", "nice", "great",
+    "hi", "hello", "hey", "yes", "no", "yep", "nope", "sure", "bye", "lol",
+))
+
+
+def _needs_rag(text: str) -> bool:
+    """Conservative client-side gate: only obvious small talk skips RAG."""
+    t = " ".join(text.lower().split()).strip(" .!,")
+    return bool(t) and t not in _SMALL_TALK
+
+
+@st.cache_resource(show_spinner=False)
+def _io_pool() -> ThreadPoolExecutor:
+    """Small per-process pool for overlapping blocking backend calls."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="synapse-io")
+
+
+def _fetch_preview_and_stats(q: str):
+    """RAG preview + KB stats, overlapped on the pooled sync client.
+
+    Returns [preview, stats]; a failed call leaves its exception in place.
+    """
+    client = st.session_state.backend_client
+    futures = [_io_pool().submit(client.rag_preview, q), _io_pool().submit(client.get_kb_stats)]
+    out = []
+    for fut in futures:
+        try:
+            out.append(fut.result())
+        except Exception as e:
+            out.append(e)
+    return out
+
+
+@st.cache_data(show_spinner=False, ttl=60, max_entries=64)
+def _rag_preview_cached(url: str, q_key: str, _q: str):
+    """(preview, stats-or-None) for a normalized query.
+
+    Keyed on url + q_key only (_q is not hashed), so resending the same
+    question, modulo case and whitespace, skips the round trip. Preview
+    errors raise and are therefore never cached. Cleared when the KB changes.
+    """
+    data, stats = _fetch_preview_and_stats(_q)
+    if isinstance(data, Exception):
+        raise data
+    return data, (None if isinstance(stats, Exception) else stats)
+
 
-st.session_state.config = _get_config_cached(BACKEND_URL)
+register_kb_cache("rag_preview", _rag_preview_cached.clear)
+
+
+def _rag_key(q: str) -> str:
+    return " ".join(q.lower().split())
 
 # ---------- Safe markdown (compat across older ChatInterface instances) ----------
 def _safe_markdown_to_html(text: str) -> str:
+    # uncached: streamed paragraphs and replies are converted once, and the
+    # final HTML is kept on the message as "_html", so they would only evict
+    # history entries from _markdown_to_html_safe's LRU
     try:
-        ci = st.session_state.get("chat_interface")
-        if ci is not None:
-            method = getattr(ci, "markdown_to_html_safe", None)
-            if callable(method):
-                return method(text)
-    except Exception:
-        pass
-    try:
-        from frontend.components.chat_interface import _markdown_to_html_safe as _fallback  # type: ignore
-        return _fallback(text)
+        return _markdown_to_html_safe_impl(text)
     except Exception:
         return text
 
+def _stream_html(text: str) -> str:
+    """Escape the in-flight tail of a streamed reply for display.
+
+    Finished paragraphs get the real markdown pass as they complete, and
+    the whole reply is converted once more on the final paint.
+    """
+    return html.escape(text, quote=False).replace("\n", "<br>")
+
 # ---------- Sidebar ----------
 def render_sidebar(current_rag_status=None):
-    sidebar = Sidebar(st.session_state.backend_client)
+    # one Sidebar per session, rebuilt only if the backend client is replaced
+    sidebar = st.session_state.get("_sidebar")
+    if sidebar is None or sidebar.backend_client is not st.session_state.backend_client:
+        sidebar = st.session_state._sidebar = Sidebar(st.session_state.backend_client)
     actions = sidebar.render(current_rag_status)
 
     if actions.get("clear_chat"):
@@ -174,9 +239,8 @@ def render_sidebar(current_rag_status=None):
         st.rerun()
 
     if actions.get("reload_kb"):
-        with st.spinner("Reindexing knowledge base…"):
-            st.session_state.backend_client.kb_reload()
-        st.success("KB reindexed")
+        if not start_reindex(st.session_state.backend_client):
+            st.success("KB reindexed")
 
     if actions.get("show_kb_stats"):
         try:
@@ -199,27 +263,159 @@ def render_chat_col(col):
             with scroller:
                 st.session_state.chat_interface.render_history(st.session_state.messages)
 
-        # Mount point for streaming, inside scroll area
-        stream_mount = scroller.container()
-
-        # Bottom pin-once script targeting the nearest container element
-        st.markdown(
-            """
-            <script>
-            (function(){
-              try {
-                const blocks = window.parent.document.querySelectorAll('[data-testid="stElementContainer"]');
-                if (blocks && blocks.length) {
-                  const el = blocks[blocks.length-1];
-                  el.scrollTop = el.scrollHeight;
-                }
-              } catch (e) {}
-            })();
-            </script>
-            """,
-            unsafe_allow_html=True,
-        )
-        return stream_mount
+        # Mount point for streaming, inside scroll area (pinned by CSS)
+        return scroller.container()
+
+# ---------- Streaming reply ----------
+# st.fragment is stable from Streamlit 1.37; 1.36 ships it as experimental
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment")
+
+def _recover_interrupted_stream() -> bool:
+    """Record the partial reply of a stream cut short by Stop (or any rerun).
+
+    Clicking Stop requests a rerun, which Streamlit raises inside the running
+    loop at its next paint; the deltas received so far live in
+    session_state._stream_parts and are kept as the assistant turn.
+    """
+    if not st.session_state.get("_streaming"):
+        return False
+    st.session_state._streaming = False
+    st.session_state._turn_pending = None  # the turn is answered (partially)
+    partial = "".join(st.session_state.pop("_stream_parts", None) or ())
+    st.session_state.messages.append({
+        "role": "assistant",
+        "content": (partial + "\n\n_[stopped]_").lstrip(),
+        "timestamp": datetime.now().isoformat(),
+        "sources": [],
+    })
+    return True
+
+
+@_fragment
+def _stream_assistant_reply(use_rag: bool, turn_id: int) -> None:
+    """Stream one assistant reply into the current container and record it.
+
+    Runs as a fragment: the bubble is its own render scope, so updates and
+    reruns scoped to it never re-execute the sidebar, compose pane or KB
+    uploader. The finished bubble stays on the page as painted; the next
+    natural rerun renders it from st.session_state.messages.
+
+    turn_id is the submitted turn this call answers; it is consumed when the
+    reply is recorded, so a later fragment rerun (e.g. a Stop click queued
+    just after the stream ended) never requests a second reply.
+    """
+    if _recover_interrupted_stream():
+        st.rerun()  # Stop was pressed: keep the partial reply, don't restream
+    if st.session_state.get("_turn_pending") != turn_id:
+        st.rerun()  # already answered: repaint from history, don't restream
+    with st.chat_message("assistant", avatar="🧠"):
+        stop_slot = st.empty()
+        stop_slot.button("⏹ Stop", key="stop_stream")
+        placeholder = st.empty()
+        parts = []  # every delta; joined once when the stream ends
+        st.session_state._stream_parts = parts  # shared, for Stop recovery
+        st.session_state._streaming = True
+        # markdown HTML of the finished paragraphs; only the deltas after
+        # them (tail_parts) are joined and re-escaped on each paint
+        committed_html = []
+        tail_parts = []
+        open_fences = 0
+        sources = []
+
+        # Throttle knobs: flush on time, size, or a sentence boundary
+        cfg = st.session_state.config
+        ui_interval = float(cfg.get("stream_ui_min_interval", 0.10))  # seconds between UI updates
+        base_interval = ui_interval  # raised while painting is slow
+        paint_ema = None  # smoothed seconds per paint
+        flush_every_chars = int(cfg.get("stream_ui_flush_chars", 256))  # also flush on this many new chars
+        min_interval = base_interval
+        last_flush = 0.0
+        last_arrival = time.monotonic()
+        gap_ema = None  # smoothed seconds between deltas
+        buffered_chars = 0
+
+        # per-token hot path: bind lookups once
+        monotonic = time.monotonic
+        paint = placeholder.markdown
+        safe_md = _safe_markdown_to_html
+        boundary = (".", "!", "?", "\n")
+
+        try:
+            for event in st.session_state.backend_client.chat_stream(
+                _backend_messages(),  # cleaned once per message, not per turn
+                temperature=cfg.get("temperature", 0.7),
+                max_tokens=cfg.get("max_tokens", 512),
+                auto_rag=use_rag,
+            ):
+                if event.get("done"):
+                    sources = event.get("sources") or []
+                    break
+                delta = event.get("delta")
+                if not delta:
+                    continue
+
+                # accumulate and flush by time/size
+                parts.append(delta)
+                tail_parts.append(delta)
+                buffered_chars += len(delta)
+                now = monotonic()
+                gap = now - last_arrival
+                last_arrival = now
+                gap_ema = gap if gap_ema is None else 0.8 * gap_ema + 0.2 * gap
+                # token bursts (<10ms apart) coalesce into fewer, larger paints
+                min_interval = max(base_interval, 0.2) if gap_ema < 0.01 else base_interval
+                elapsed = now - last_flush
+                if (
+                    elapsed >= min_interval
+                    or buffered_chars >= flush_every_chars
+                    or (elapsed >= min_interval / 2 and delta.endswith(boundary))
+                ):
+                    # commit paragraphs that ended with a blank line outside a code fence
+                    tail = "".join(tail_parts)
+                    cut = tail.rfind("\n\n")
+                    if cut >= 0:
+                        seg = tail[:cut]
+                        fences = open_fences + seg.count("```")
+                        if fences % 2 == 0:
+                            committed_html.append(safe_md(seg) + "<br><br>")
+                            tail = tail[cut + 2:]
+                            open_fences = fences
+                    tail_parts = [tail]
+                    paint(
+                        "".join(committed_html) + _stream_html(tail) + " ▋",
+                        unsafe_allow_html=True,
+                    )
+                    last_flush = monotonic()
+                    buffered_chars = 0
+                    # backpressure: if painting can't keep up, paint less often;
+                    # smoothed, so one slow paint eases off instead of sticking
+                    cost = last_flush - now
+                    paint_ema = cost if paint_ema is None else 0.7 * paint_ema + 0.3 * cost
+                    base_interval = min(max(ui_interval, paint_ema * 2), 1.0)
+
+            full = "".join(parts)
+        except Exception as e:
+            full = f"**Error:** {e}"
+        st.session_state._streaming = False
+        st.session_state.pop("_stream_parts", None)
+        stop_slot.empty()  # nothing left in the bubble can rerun it
+
+        # Final paint
+        full_html = _safe_markdown_to_html(full)
+        placeholder.markdown(full_html, unsafe_allow_html=True)
+        if sources:
+            st.session_state.chat_interface.render_sources(sources)
+
+    # Persist assistant turn locally (frontend session); "_html" caches the
+    # rendered body for render_history and must be dropped if content changes
+    st.session_state.messages.append({
+        "role": "assistant",
+        "content": full,
+        "timestamp": datetime.now().isoformat(),
+        "sources": sources,
+        "_html": full_html,
+    })
+    st.session_state._turn_pending = None
 
 # ---------- Compose / RAG / KB column (LEFT) ----------
 def render_compose_col(col, chat_pane_ref):
@@ -259,11 +455,13 @@ def render_compose_col(col, chat_pane_ref):
             if st.button("💾 Apply", use_container_width=True, type="primary"):
                 try:
                     if new_rag_status != current_rag_status:
-                        result = st.session_state.backend_client.set_rag_state({"auto_rag": new_rag_status})
-                        st.success(f"✅ RAG {'enabled' if result['auto_rag'] else 'disabled'}")
-                        # Refresh config to get updated state
-                        st.session_state.config = st.session_state.backend_client.get_config()
-                        st.rerun()
+                        result = st.session_state.backend_client.set_rag_state(new_rag_status)
+                        # Merge the reply locally; no GET and no extra rerun.
+                        # The cache is only dropped so later runs stop serving
+                        # the old auto_rag value.
+                        st.session_state.config["auto_rag"] = bool(result.get("auto_rag", new_rag_status))
+                        _load_config.clear()
+                        st.success(f"✅ RAG {'enabled' if st.session_state.config['auto_rag'] else 'disabled'}")
                     else:
                         st.info("No changes to apply")
                 except Exception as e:
@@ -273,7 +471,7 @@ def render_compose_col(col, chat_pane_ref):
             # Refresh button
             if st.button("🔄 Refresh", use_container_width=True, type="secondary"):
                 try:
-                    st.session_state.config = st.session_state.backend_client.get_config()
+                    _load_config.clear()
                     st.success("Config refreshed")
                     st.rerun()
                 except Exception as e:
@@ -302,7 +500,7 @@ def render_compose_col(col, chat_pane_ref):
             st.session_state.compose_text = ""
             st.session_state._pending_clear_compose = False
 
-        with st.form("compose_form", clear_on_submit=False):
+        with st.form("compose_form", clear_on_submit=True):
             st.text_area(
                 "Message",
                 key="compose_text",
@@ -326,7 +524,10 @@ def render_compose_col(col, chat_pane_ref):
 
         def show_rag_preview(q: str):
             try:
-                data = st.session_state.backend_client.rag_preview(q)
+                data, stats = _rag_preview_cached(BACKEND_URL, _rag_key(q), q)
+                if stats is not None:
+                    # picked up by the sidebar on the next run
+                    st.session_state["_prefetched_kb_stats"] = stats
                 
                 # Check if RAG is disabled
                 if data.get("message") == "RAG is currently disabled":
@@ -382,24 +583,27 @@ def render_compose_col(col, chat_pane_ref):
             try:
                 payload = []
                 for f in uploads:
-                    payload.append(("files", f.getvalue(), f.type or "application/octet-stream", f.name))
-                st.session_state.backend_client.kb_upload(payload)
-                with st.spinner("Reindexing…"):
-                    st.session_state.backend_client.kb_reload()
-                st.success("KB updated")
+                    f.seek(0)  # pass the UploadedFile itself; kb_upload streams it
+                    payload.append(("files", f, f.type or "application/octet-stream", f.name))
+                # reindexed by the upload itself; reindex_progress follows the job
+                if not upload_and_reindex(st.session_state.backend_client, payload):
+                    st.success("KB updated")
             except Exception as e:
                 st.error(f"Upload failed: {e}")
+        reindex_slot = st.container()
 
         # Handle submit
         if not submitted:
             st.markdown('</div>', unsafe_allow_html=True)
-            return
+            return reindex_slot
 
         q = (st.session_state.compose_text or "").strip()
         if not q:
             st.warning("Type a message first.")
-            return
+            return reindex_slot
 
+        # the toggle enables RAG; small talk still skips backend retrieval
+        use_rag = use_rag and _needs_rag(q)
         if use_rag:
             show_rag_preview(q)
         else:
@@ -412,85 +616,18 @@ def render_compose_col(col, chat_pane_ref):
             "timestamp": datetime.now().isoformat(),
         })
 
-        # Stream assistant reply into RIGHT chat pane, with THROTTLE
+        # Paint the new turn below the already-rendered history and stream the
+        # reply into the RIGHT chat pane. The page is complete afterwards, so
+        # no st.rerun() re-renders the whole conversation for this turn; the
+        # form's clear_on_submit empties the box.
+        turn_id = st.session_state.get("_turn_seq", 0) + 1
+        st.session_state._turn_seq = st.session_state._turn_pending = turn_id
         with chat_pane_ref:
-            # open bubble inside the same scrollable div
-            with st.chat_message("assistant", avatar="🧠"):
-                placeholder = st.empty()
-                full = ""
-                sources = []
-
-                # Throttle knobs
-                last_flush = 0.0
-                min_interval = 0.04  # seconds between UI updates
-                buffered_chars = 0
-                flush_every_chars = 120  # also flush on this many new chars
-
-                try:
-                    for event in st.session_state.backend_client.chat_stream(
-                        _clean_messages_for_backend(st.session_state.messages),  # Clean messages before sending
-                        temperature=st.session_state.config.get("temperature", 0.7),
-                        max_tokens=st.session_state.config.get("max_tokens", 512),
-                        auto_rag=use_rag,
-                    ):
-                        if event.get("done"):
-                            sources = event.get("sources", [])
-                            break
-                        delta = event.get("delta", "")
-                        if not delta:
-                            continue
-
-                        # accumulate and flush by time/size
-                        full += delta
-                        buffered_chars += len(delta)
-                        now = time.time()
-                        if (now - last_flush) >= min_interval or buffered_chars >= flush_every_chars:
-                            # Use safe HTML markdown (compat helper)
-                            placeholder.markdown(
-                                _safe_markdown_to_html(full) + " ▋",
-                                unsafe_allow_html=True,
-                            )
-                            last_flush = now
-                            buffered_chars = 0
-
-                            # keep view pinned to the bottom of chat pane
-                            st.markdown(
-                                """
-                                <script>
-                                  try {
-                                    const doc = window.document;
-                                    const pdoc = window.parent && window.parent.document ? window.parent.document : doc;
-                                    const scroller = pdoc.getElementById('chat-scroll') || doc.getElementById('chat-scroll');
-                                    if (scroller) scroller.scrollTop = scroller.scrollHeight;
-                                  } catch (e) {}
-                                </script>
-                                """,
-                                unsafe_allow_html=True,
-                            )
-
-                except Exception as e:
-                    full = f"**Error:** {e}"
-
-                # Final paint
-                placeholder.markdown(
-                    _safe_markdown_to_html(full),
-                    unsafe_allow_html=True,
-                )
-                if sources:
-                    st.session_state.chat_interface.render_sources(sources)
-
-        # Persist assistant turn locally (frontend session)
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": full,
-            "timestamp": datetime.now().isoformat(),
-            "sources": sources,
-        })
+            st.session_state.chat_interface.render_user_message(q)
+            _stream_assistant_reply(use_rag, turn_id)
 
-        # Clear input next run
-        st.session_state._pending_clear_compose = True
         st.markdown('</div>', unsafe_allow_html=True)
-        st.rerun()
+        return reindex_slot
 
 def _clean_messages_for_backend(messages: List[Dict]) -> List[Dict[str, str]]:
     """Clean messages to match backend API expectations."""
@@ -504,8 +641,60 @@ def _clean_messages_for_backend(messages: List[Dict]) -> List[Dict[str, str]]:
         cleaned.append(cleaned_msg)
     return cleaned
 
+# History sent to the backend is bounded: past _EVICT_AFTER messages, all
+# but the newest _KEEP_RECENT lose their bodies (roles stay, so turn order is
+# intact); after _IDLE_TTL_S without activity, history before the newest
+# _IDLE_KEEP is dropped for the rest of the conversation (_idle_cut).
+_EVICT_AFTER = 30
+_KEEP_RECENT = 10
+_EVICT_STEP = 10
+_IDLE_TTL_S = 900
+_IDLE_KEEP = 10
+_ARCHIVED = {"user": {"role": "user", "content": "[archived]"},
+             "assistant": {"role": "assistant", "content": "[archived]"}}
+
+
+def _evict_history(msgs: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    if len(msgs) <= _EVICT_AFTER:
+        return msgs
+    # archive boundary moves in steps so the prompt prefix stays identical
+    # across several turns (prefix-cache friendly)
+    cut = (len(msgs) - _KEEP_RECENT) // _EVICT_STEP * _EVICT_STEP
+    archived = [_ARCHIVED.get(m["role"]) or {"role": m["role"], "content": "[archived]"} for m in msgs[:cut]]
+    return archived + msgs[cut:]
+
+
+def _backend_messages() -> List[Dict[str, str]]:
+    """Cleaned, eviction-bounded copy of st.session_state.messages.
+
+    Only messages appended since the last call are cleaned; replacing the
+    messages list (clear / new chat) or shrinking it starts over. The full
+    cleaned list stays cached; eviction only shapes what is sent.
+    """
+    msgs = st.session_state.messages
+    cache = st.session_state.get("_cleaned_messages")
+    if cache is None or cache[0] is not msgs or len(cache[1]) > len(msgs):
+        cache = (msgs, [])
+        st.session_state._cleaned_messages = cache
+        st.session_state._idle_cut = 0
+    cleaned = cache[1]
+    if len(cleaned) < len(msgs):
+        cleaned.extend(_clean_messages_for_backend(msgs[len(cleaned):]))
+    now = time.time()
+    idle_s = now - st.session_state.get("_last_activity", now)
+    st.session_state._last_activity = now
+    # the idle trim persists: later turns slice from the same index, so the
+    # context doesn't jump back to full length and the prefix stays stable
+    idle_cut = st.session_state.get("_idle_cut", 0)
+    if idle_s > _IDLE_TTL_S:
+        idle_cut = st.session_state._idle_cut = max(idle_cut, len(cleaned) - _IDLE_KEEP)
+    return _evict_history(cleaned[idle_cut:])
+
 # ---------- Page body ----------
 def main():
+    # A stream cut short by a full-app rerun keeps what it had received
+    _recover_interrupted_stream()
+
     # Sidebar controls & info
     # Pass current RAG status from toggle to sidebar for consistency
     current_rag_status = st.session_state.get("global_rag_toggle", st.session_state.config.get("auto_rag", False))
@@ -522,7 +711,10 @@ def main():
     # Two columns: left compose (narrower), right chat (wider)
     left, right = st.columns([1.4, 2.6], gap="large")
     chat_pane_ref = render_chat_col(right)  # render history first
-    render_compose_col(left, chat_pane_ref=chat_pane_ref)
+    reindex_slot = render_compose_col(left, chat_pane_ref=chat_pane_ref)
+    if reindex_slot is not None:
+        with reindex_slot:
+            reindex_progress()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
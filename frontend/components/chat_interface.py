@@ -10,8 +10,9 @@ from __future__ import annotations
 
 from typing import List, Dict, Any, Iterable, Optional, Tuple
 from datetime import datetime
-import html
+import functools
 import re
+import time
 
 import streamlit as st
 
@@ -24,6 +25,15 @@ def _now_iso() -> str:
     return datetime.now().isoformat()
 
 def _format_rel_time(ts: str) -> str:
+    # minute buckets: the label changes at most once a minute, so each
+    # timestamp is parsed at most once per minute across reruns
+    return _format_rel_time_cached(ts, int(time.time() // 60))
+
+@functools.lru_cache(maxsize=4096)
+def _format_rel_time_cached(ts: str, minute: int) -> str:
+    return _format_rel_time_impl(ts)
+
+def _format_rel_time_impl(ts: str) -> str:
     try:
         dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
         now = datetime.now(dt.tzinfo) if dt.tzinfo else datetime.now()
@@ -39,33 +49,122 @@ def _format_rel_time(ts: str) -> str:
     except Exception:
         return "Now"
 
-_md_codeblock = re.compile(r"```(\w+)?\n(.*?)\n```", re.DOTALL)
-_md_inlinecode = re.compile(r"`([^`]+)`")
-_md_bold = re.compile(r"\*\*(.*?)\*\*")
-_md_italic = re.compile(r"(?<!\*)\*(?!\*)(.*?)\*(?<!\*)")
-
-def _markdown_to_html_safe(md: str) -> str:
+# stream_assistant_reply paints at most every _STREAM_MIN_INTERVAL seconds
+# and only once at least _STREAM_MIN_CHARS new characters have arrived
+_STREAM_MIN_INTERVAL = 0.05
+_STREAM_MIN_CHARS = 8
+
+def _coalesce(
+    events: Iterable[Dict[str, Any]], max_chars: int = 64, max_ms: float = 30
+) -> Iterable[Dict[str, Any]]:
+    """Merge consecutive deltas until max_chars or max_ms, then yield one."""
+    buf: List[str] = []
+    size = 0
+    t0 = time.monotonic()
+    for ev in events:
+        if ev.get("done"):
+            if buf:
+                yield {"delta": "".join(buf)}
+            yield ev
+            return
+        delta = ev.get("delta", "")
+        if not delta:
+            continue
+        buf.append(delta)
+        size += len(delta)
+        now = time.monotonic()
+        if size >= max_chars or (now - t0) * 1000 >= max_ms:
+            yield {"delta": "".join(buf)}
+            buf, size, t0 = [], 0, now
+    if buf:
+        yield {"delta": "".join(buf)}
+
+# One alternation instead of four passes; code wins over emphasis at the
+# same position, and emphasis bodies are re-scanned so nesting still works.
+_MD_RE = re.compile(
+    r"(?P<code>```(?:\w+)?\n(?P<code_body>.*?)\n```)"
+    r"|(?P<inline>`(?P<inline_body>[^`]+)`)"
+    r"|(?P<bold>\*\*(?P<bold_body>.*?)\*\*)"
+    r"|(?P<ital>(?<!\*)\*(?!\*)(?P<ital_body>.*?)\*(?<!\*))",
+    re.DOTALL,
+)
+
+# html.escape(quote=True) as a single C-level pass
+_HTML_ESC_TABLE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"})
+_HTML_SPECIAL_RE = re.compile(r"[&<>\"']")
+
+# any character that _markdown_to_html_safe would change or act on
+_SPECIAL_RE = re.compile(r"[&<>\"'`*\n]")
+
+
+def _md_sub(m: "re.Match[str]") -> str:
+    kind = m.lastgroup
+    if kind == "code":
+        return f'<div class="code-block"><code>{m.group("code_body")}</code></div>'
+    if kind == "inline":
+        return f'<code class="inline-code">{m.group("inline_body")}</code>'
+    if kind == "bold":
+        return f"<strong>{_MD_RE.sub(_md_sub, m.group('bold_body'))}</strong>"
+    return f"<em>{_MD_RE.sub(_md_sub, m.group('ital_body'))}</em>"
+
+def _markdown_to_html_safe_impl(md: str) -> str:
     """Very light md -> HTML; rely mostly on Streamlit's markdown.
     Here we only ensure weird HTML doesn't escape the box."""
     if not md:
         return ""
+    # plain prose: nothing to escape, convert or break
+    if not _SPECIAL_RE.search(md):
+        return md
 
     # escape raw HTML to avoid breaking layout
-    md = html.escape(md)
+    md = md.translate(_HTML_ESC_TABLE)
 
     # restore common markdown affordances
-    md = _md_codeblock.sub(lambda m: f'<div class="code-block"><code>{m.group(2)}</code></div>', md)
-    md = _md_inlinecode.sub(lambda m: f'<code class="inline-code">{m.group(1)}</code>', md)
-    md = _md_bold.sub(lambda m: f"<strong>{m.group(1)}</strong>", md)
-    md = _md_italic.sub(lambda m: f"<em>{m.group(1)}</em>", md)
+    if "`" in md or "*" in md:
+        md = _MD_RE.sub(_md_sub, md)
     md = md.replace("\n", "<br>")
     return md
 
 
+@functools.lru_cache(maxsize=1024)
+def _markdown_to_html_safe(md: str) -> str:
+    """Cached _markdown_to_html_safe_impl: history content never changes, so
+    reruns convert each message once. Streaming (app._safe_markdown_to_html)
+    calls the impl directly so partial replies never enter this cache."""
+    return _markdown_to_html_safe_impl(md)
+
+
 # --------------------------------------------------------------------------- #
 # Chat UI
 # --------------------------------------------------------------------------- #
 
+_BASE_CSS = """
+<style>
+  /* Keep chat nicely centered and bounded */
+  .stChatMessage { max-width: 900px; margin-left: auto; margin-right: auto; }
+  /* Make markdown breathe */
+  [data-testid="stChatMessageContent"] p { margin-bottom: .5rem; }
+  /* Code blocks */
+  .code-block {
+      display:block; white-space:pre-wrap; font-family: ui-monospace, SFMono-Regular, Menlo, monospace;
+      background:#0b1020; color:#e6edf3; border-radius:12px; padding:12px; border:1px solid #1f2a44;
+  }
+  .inline-code {
+      font-family: ui-monospace, SFMono-Regular, Menlo, monospace;
+      background:#0b1020; color:#e6edf3; padding:2px 6px; border-radius:6px;
+      border:1px solid #1f2a44;
+  }
+  /* Source expander polish */
+  .lm-source-chip {
+      background:#0969da; color:white; padding:2px 8px; border-radius:999px; font-size:12px; font-weight:600;
+  }
+  .lm-source-box {
+      border:1px solid rgba(0,0,0,.08); border-radius:10px; padding:10px; background:#f8f9fa;
+  }
+</style>
+"""
+
+
 class ChatInterface:
     """Main chat interface component (stable, streaming-friendly)."""
 
@@ -77,34 +176,7 @@ class ChatInterface:
     # ----- CSS -------------------------------------------------------------- #
     @staticmethod
     def _inject_base_css() -> None:
-        st.markdown(
-            """
-            <style>
-              /* Keep chat nicely centered and bounded */
-              .stChatMessage { max-width: 900px; margin-left: auto; margin-right: auto; }
-              /* Make markdown breathe */
-              [data-testid="stChatMessageContent"] p { margin-bottom: .5rem; }
-              /* Code blocks */
-              .code-block {
-                  display:block; white-space:pre-wrap; font-family: ui-monospace, SFMono-Regular, Menlo, monospace;
-                  background:#0b1020; color:#e6edf3; border-radius:12px; padding:12px; border:1px solid #1f2a44;
-              }
-              .inline-code {
-                  font-family: ui-monospace, SFMono-Regular, Menlo, monospace;
-                  background:#0b1020; color:#e6edf3; padding:2px 6px; border-radius:6px;
-                  border:1px solid #1f2a44;
-              }
-              /* Source expander polish */
-              .lm-source-chip {
-                  background:#0969da; color:white; padding:2px 8px; border-radius:999px; font-size:12px; font-weight:600;
-              }
-              .lm-source-box {
-                  border:1px solid rgba(0,0,0,.08); border-radius:10px; padding:10px; background:#f8f9fa;
-              }
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
+        st.markdown(_BASE_CSS, unsafe_allow_html=True)
 
     # ----- Welcome ---------------------------------------------------------- #
     def render_welcome(self) -> None:
@@ -113,24 +185,17 @@ class ChatInterface:
 
     # ----- History ---------------------------------------------------------- #
     def render_history(self, messages: List[Dict[str, Any]]) -> None:
-        """Render full conversation, oldest -> newest (ChatGPT style)."""
+        """Render full conversation, oldest -> newest (ChatGPT style).
+
+        A message may carry "_html", its already-rendered body (set when the
+        reply finished streaming); it is used as-is, so whoever edits a
+        message's content must drop that key.
+        """
         if not messages:
             self.render_welcome()
             return
 
-        # Deduplicate consecutive identical messages (same role and content)
-        deduped: List[Dict[str, Any]] = []
-        last_key: Optional[Tuple[str, str]] = None
-        for m in messages:
-            role_m = m.get("role", "assistant")
-            content_m = m.get("content", "") or ""
-            key = (role_m, content_m)
-            if key == last_key:
-                continue
-            deduped.append(m)
-            last_key = key
-
-        for msg in deduped:
+        for msg in self._deduped(messages):
             role = msg.get("role", "assistant")
             content = msg.get("content", "")
             ts = _format_rel_time(msg.get("timestamp", _now_iso()))
@@ -139,18 +204,47 @@ class ChatInterface:
             with st.chat_message(role, avatar=avatar):
                 # Use Streamlit markdown to keep within the message bubble.
                 # We still pre-sanitize to avoid HTML breaking layout.
-                st.markdown(_markdown_to_html_safe(content), unsafe_allow_html=True)
+                # empty bodies (e.g. an interrupted reply) get just the caption
+                if content and not content.isspace():
+                    st.markdown(msg.get("_html") or _markdown_to_html_safe(content), unsafe_allow_html=True)
                 st.caption(ts)
                 if role == "assistant" and msg.get("sources"):
                     self.render_sources(msg["sources"])
 
+    @staticmethod
+    def _deduped(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Messages without consecutive duplicates (same role and content).
+
+        Cached in session_state per history version (list identity, length
+        and last message), so unchanged history is not rescanned each rerun.
+        """
+        sig = (id(messages), len(messages), id(messages[-1]))
+        cached = st.session_state.get("_dedup_cache")
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+
+        deduped: List[Dict[str, Any]] = []
+        last: Optional[Tuple[str, int, str, str]] = None
+        for m in messages:
+            role_m = m.get("role", "assistant")
+            content_m = m.get("content", "") or ""
+            # role, length and prefix rule out almost every pair before the
+            # full string compare
+            key = (role_m, len(content_m), content_m[:32])
+            if last is not None and key == last[:3] and content_m == last[3]:
+                continue
+            deduped.append(m)
+            last = (*key, content_m)
+        st.session_state["_dedup_cache"] = (sig, deduped)
+        return deduped
+
     # Compatibility: render a single message (API expected by some callers)
     def render_message(self, message: Dict[str, Any], index: int) -> None:
         role = message.get("role", "assistant")
         content = message.get("content", "")
         avatar = "👤" if role == "user" else "🧠"
         with st.chat_message(role, avatar=avatar):
-            st.markdown(_markdown_to_html_safe(content), unsafe_allow_html=True)
+            st.markdown(message.get("_html") or _markdown_to_html_safe(content), unsafe_allow_html=True)
             if role == "assistant" and message.get("sources"):
                 self.render_sources(message["sources"])
 
@@ -162,13 +256,23 @@ class ChatInterface:
         show_cursor: bool = True,
         show_sources: bool = True,
     ) -> Tuple[str, List[Dict[str, Any]]]:
-        """Stream tokens as they arrive. Returns (full_text, sources)."""
+        """Stream tokens as they arrive. Returns (full_text, sources).
+
+        Finished blocks (ending in a blank line outside a code fence) are
+        converted once and kept as HTML; each update only re-renders the
+        trailing, still-growing block.
+        """
         full = ""
         sources: List[Dict[str, Any]] = []
+        stable_html = ""  # HTML of the completed blocks
+        unstable_md = ""  # markdown after the last completed block
+        cursor = " ▋" if show_cursor else ""
+        last_flush = 0.0
+        last_len = 0  # len(full) at the last paint
 
         with st.chat_message("assistant", avatar="🧠"):
             placeholder = st.empty()
-            for ev in events:
+            for ev in _coalesce(events):
                 if ev.get("done"):
                     sources = ev.get("sources", []) or []
                     break
@@ -176,11 +280,25 @@ class ChatInterface:
                 if not delta:
                     continue
                 full += delta
-                # Single placeholder update → fast
-                cursor = " ▋" if show_cursor else ""
-                placeholder.markdown(_markdown_to_html_safe(full) + cursor, unsafe_allow_html=True)
-
-            placeholder.markdown(_markdown_to_html_safe(full), unsafe_allow_html=True)
+                unstable_md += delta
+                if "\n" in delta:
+                    cut = unstable_md.rfind("\n\n")
+                    # committed blocks always close their fences, so an even
+                    # count means the cut is outside a code block
+                    if cut >= 0 and unstable_md.count("```", 0, cut) % 2 == 0:
+                        stable_html += _markdown_to_html_safe_impl(unstable_md[:cut]) + "<br><br>"
+                        unstable_md = unstable_md[cut + 2:]
+                # Single placeholder update, at most ~20 per second
+                now = time.monotonic()
+                if now - last_flush >= _STREAM_MIN_INTERVAL and len(full) - last_len >= _STREAM_MIN_CHARS:
+                    # the growing tail is shown escaped only; it gets the
+                    # markdown pass once its block completes (or at the end)
+                    tail = unstable_md.translate(_HTML_ESC_TABLE).replace("\n", "<br>")
+                    placeholder.markdown(stable_html + tail + cursor, unsafe_allow_html=True)
+                    last_flush = now
+                    last_len = len(full)
+
+            placeholder.markdown(stable_html + _markdown_to_html_safe_impl(unstable_md), unsafe_allow_html=True)
             if show_sources and sources:
                 self.render_sources(sources)
 
@@ -194,6 +312,12 @@ class ChatInterface:
     # ----- Sources ---------------------------------------------------------- #
     def render_sources(self, sources: List[Dict[str, Any]]) -> None:
         """Compact, readable RAG source list."""
+        # entries with neither text nor a name would only add empty rows
+        sources = [
+            s for s in sources or ()
+            if (s.get("snippet") or s.get("content") or s.get("text") or "").strip()
+            or s.get("title") or s.get("filename") or s.get("doc")
+        ]
         if not sources:
             return
         with st.expander(f"📚 Sources ({len(sources)})", expanded=False):
@@ -201,8 +325,8 @@ class ChatInterface:
                 title = s.get("title") or s.get("filename") or s.get("doc") or f"Source {i}"
                 score = s.get("relevance_score", s.get("score"))
                 page = s.get("page") or s.get("chunk_id")
-                snippet = s.get("snippet") or s.get("content") or s.get("text") or ""
-                snippet = (snippet or "").strip()
+                # strip() hands back the same object when there's nothing to trim
+                snippet = (s.get("snippet") or s.get("content") or s.get("text") or "").strip()
                 if len(snippet) > 700:
                     snippet = snippet[:700] + " …"
 
@@ -216,7 +340,9 @@ class ChatInterface:
                 st.markdown(" ".join(header_bits), unsafe_allow_html=True)
 
                 # Snippet box
-                st.markdown(f"<div class='lm-source-box'><pre>{html.escape(snippet)}</pre></div>", unsafe_allow_html=True)
+                if not snippet:
+                    continue
+                st.markdown(f"<div class='lm-source-box'><pre>{snippet.translate(_HTML_ESC_TABLE) if _HTML_SPECIAL_RE.search(snippet) else snippet}</pre></div>", unsafe_allow_html=True)
 
     # Public alias for downstream code expecting this name
     def markdown_to_html_safe(self, content: str) -> str:
@@ -275,11 +401,15 @@ class MessageComposer:
             with c1:
                 submitted = st.form_submit_button("Send", use_container_width=True, disabled=disabled)
             with c2:
-                cleared = st.form_submit_button("Clear", use_container_width=True, disabled=disabled)
-
-        if cleared:
-            st.session_state[f"{self.key_prefix}_clear_next"] = True
-            st.rerun()
+                # the callback runs before the rerun the click starts, so the
+                # box is already empty then and no second st.rerun() is needed
+                st.form_submit_button(
+                    "Clear",
+                    use_container_width=True,
+                    disabled=disabled,
+                    on_click=st.session_state.__setitem__,
+                    args=(f"{self.key_prefix}_text", ""),
+                )
 
         if submitted:
             text = (st.session_state.get(f"{self.key_prefix}_text") or "").strip()
@@ -7,9 +7,190 @@ import streamlit as st
 import time
 import json
 from datetime import datetime
+from html import escape
+from operator import itemgetter
 from typing import Dict, List, Any, Optional
 import requests
 
+# One keep-alive session for every backend call from this module
+_SESSION = requests.Session()
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def _fetch_kb_stats() -> Optional[Dict[str, Any]]:
+    """KB stats, shared by reruns for 10s; None if the backend says no."""
+    response = _SESSION.get("http://127.0.0.1:9000/kb/stats", timeout=5)
+    if response.status_code != 200:
+        return None
+    return response.json()
+
+
+# every chat_history entry has all three keys (see process_user_input)
+_MSG_FIELDS = itemgetter('role', 'content', 'timestamp')
+_USER_TMPL = '<div class="user-message">{c}<div class="message-timestamp">{t}</div></div>'
+_ASSIST_TMPL = '<div class="assistant-message">{c}<div class="message-timestamp">{t}</div></div>'
+
+
+def _set_chat_mode(mode: str) -> None:
+    st.session_state.chat_mode = mode
+
+
+# Built once at import; emitted every run, since Streamlit drops elements a
+# rerun does not re-emit.
+_ENHANCED_CSS = """
+<style>
+/* Modern Chat Interface Styling */
+.chat-container {
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    border-radius: 20px;
+    padding: 20px;
+    margin: 10px 0;
+    box-shadow: 0 8px 32px rgba(0,0,0,0.1);
+}
+
+.user-message {
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: white;
+    padding: 15px 20px;
+    border-radius: 20px 20px 5px 20px;
+    margin: 10px 0;
+    box-shadow: 0 4px 15px rgba(0,0,0,0.1);
+    max-width: 80%;
+    margin-left: auto;
+}
+
+.assistant-message {
+    background: white;
+    color: #333;
+    padding: 15px 20px;
+    border-radius: 20px 20px 20px 5px;
+    margin: 10px 0;
+    box-shadow: 0 4px 15px rgba(0,0,0,0.1);
+    max-width: 80%;
+    border-left: 4px solid #667eea;
+}
+
+.message-timestamp {
+    font-size: 0.7em;
+    color: #888;
+    margin-top: 5px;
+    text-align: right;
+}
+
+.input-container {
+    background: white;
+    border-radius: 25px;
+    padding: 5px;
+    box-shadow: 0 4px 15px rgba(0,0,0,0.1);
+    margin: 20px 0;
+}
+
+.send-button {
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: white;
+    border: none;
+    border-radius: 20px;
+    padding: 10px 25px;
+    font-weight: bold;
+    cursor: pointer;
+    transition: all 0.3s ease;
+}
+
+.send-button:hover {
+    transform: translateY(-2px);
+    box-shadow: 0 6px 20px rgba(0,0,0,0.2);
+}
+
+.mode-selector {
+    background: white;
+    border-radius: 15px;
+    padding: 15px;
+    margin: 15px 0;
+    box-shadow: 0 4px 15px rgba(0,0,0,0.1);
+}
+
+.file-upload-area {
+    border: 2px dashed #667eea;
+    border-radius: 15px;
+    padding: 30px;
+    text-align: center;
+    background: rgba(102, 126, 234, 0.05);
+    margin: 15px 0;
+}
+
+.error-message {
+    background: #ff6b6b;
+    color: white;
+    padding: 15px;
+    border-radius: 10px;
+    margin: 10px 0;
+    border-left: 4px solid #d63031;
+}
+
+.success-message {
+    background: #00b894;
+    color: white;
+    padding: 15px;
+    border-radius: 10px;
+    margin: 10px 0;
+    border-left: 4px solid #00a085;
+}
+
+.loading-spinner {
+    text-align: center;
+    padding: 20px;
+    color: #667eea;
+}
+
+.chat-header {
+    text-align: center;
+    margin-bottom: 30px;
+}
+
+.chat-header h1 {
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    -webkit-background-clip: text;
+    -webkit-text-fill-color: transparent;
+    font-size: 2.5em;
+    font-weight: bold;
+    margin-bottom: 10px;
+}
+
+.chat-header p {
+    color: #666;
+    font-size: 1.1em;
+}
+
+.stats-container {
+    display: flex;
+    justify-content: space-around;
+    margin: 20px 0;
+    flex-wrap: wrap;
+}
+
+.stat-item {
+    background: white;
+    padding: 15px;
+    border-radius: 15px;
+    text-align: center;
+    box-shadow: 0 4px 15px rgba(0,0,0,0.1);
+    margin: 5px;
+    min-width: 120px;
+}
+
+.stat-number {
+    font-size: 1.5em;
+    font-weight: bold;
+    color: #667eea;
+}
+
+.stat-label {
+    color: #666;
+    font-size: 0.9em;
+}
+</style>
+"""
+
 class EnhancedChatInterface:
     """Enhanced chat interface with modern design and better UX"""
     
@@ -32,159 +213,7 @@ class EnhancedChatInterface:
     
     def setup_styling(self):
         """Apply custom CSS for modern design"""
-        st.markdown("""
-        <style>
-        /* Modern Chat Interface Styling */
-        .chat-container {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            border-radius: 20px;
-            padding: 20px;
-            margin: 10px 0;
-            box-shadow: 0 8px 32px rgba(0,0,0,0.1);
-        }
-        
-        .user-message {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 15px 20px;
-            border-radius: 20px 20px 5px 20px;
-            margin: 10px 0;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-            max-width: 80%;
-            margin-left: auto;
-        }
-        
-        .assistant-message {
-            background: white;
-            color: #333;
-            padding: 15px 20px;
-            border-radius: 20px 20px 20px 5px;
-            margin: 10px 0;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-            max-width: 80%;
-            border-left: 4px solid #667eea;
-        }
-        
-        .message-timestamp {
-            font-size: 0.7em;
-            color: #888;
-            margin-top: 5px;
-            text-align: right;
-        }
-        
-        .input-container {
-            background: white;
-            border-radius: 25px;
-            padding: 5px;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-            margin: 20px 0;
-        }
-        
-        .send-button {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            border-radius: 20px;
-            padding: 10px 25px;
-            font-weight: bold;
-            cursor: pointer;
-            transition: all 0.3s ease;
-        }
-        
-        .send-button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 6px 20px rgba(0,0,0,0.2);
-        }
-        
-        .mode-selector {
-            background: white;
-            border-radius: 15px;
-            padding: 15px;
-            margin: 15px 0;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-        }
-        
-        .file-upload-area {
-            border: 2px dashed #667eea;
-            border-radius: 15px;
-            padding: 30px;
-            text-align: center;
-            background: rgba(102, 126, 234, 0.05);
-            margin: 15px 0;
-        }
-        
-        .error-message {
-            background: #ff6b6b;
-            color: white;
-            padding: 15px;
-            border-radius: 10px;
-            margin: 10px 0;
-            border-left: 4px solid #d63031;
-        }
-        
-        .success-message {
-            background: #00b894;
-            color: white;
-            padding: 15px;
-            border-radius: 10px;
-            margin: 10px 0;
-            border-left: 4px solid #00a085;
-        }
-        
-        .loading-spinner {
-            text-align: center;
-            padding: 20px;
-            color: #667eea;
-        }
-        
-        .chat-header {
-            text-align: center;
-            margin-bottom: 30px;
-        }
-        
-        .chat-header h1 {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-            font-size: 2.5em;
-            font-weight: bold;
-            margin-bottom: 10px;
-        }
-        
-        .chat-header p {
-            color: #666;
-            font-size: 1.1em;
-        }
-        
-        .stats-container {
-            display: flex;
-            justify-content: space-around;
-            margin: 20px 0;
-            flex-wrap: wrap;
-        }
-        
-        .stat-item {
-            background: white;
-            padding: 15px;
-            border-radius: 15px;
-            text-align: center;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-            margin: 5px;
-            min-width: 120px;
-        }
-        
-        .stat-number {
-            font-size: 1.5em;
-            font-weight: bold;
-            color: #667eea;
-        }
-        
-        .stat-label {
-            color: #666;
-            font-size: 0.9em;
-        }
-        </style>
-        """, unsafe_allow_html=True)
+        st.markdown(_ENHANCED_CSS, unsafe_allow_html=True)
     
     def render_header(self):
         """Render the enhanced chat header"""
@@ -201,29 +230,27 @@ class EnhancedChatInterface:
         
         col1, col2, col3 = st.columns(3)
         
+        # on_click runs before the rerun the click already triggers, so the
+        # rest of the page renders in the new mode without another st.rerun()
         with col1:
-            if st.button("💬 Chat", key="chat_mode_btn", use_container_width=True):
-                st.session_state.chat_mode = "chat"
-                st.rerun()
+            st.button("💬 Chat", key="chat_mode_btn", use_container_width=True,
+                      on_click=_set_chat_mode, args=("chat",))
         
         with col2:
-            if st.button("🔍 RAG Search", key="rag_mode_btn", use_container_width=True):
-                st.session_state.chat_mode = "rag"
-                st.rerun()
+            st.button("🔍 RAG Search", key="rag_mode_btn", use_container_width=True,
+                      on_click=_set_chat_mode, args=("rag",))
         
         with col3:
-            if st.button("📁 Upload Files", key="upload_mode_btn", use_container_width=True):
-                st.session_state.chat_mode = "upload"
-                st.rerun()
+            st.button("📁 Upload Files", key="upload_mode_btn", use_container_width=True,
+                      on_click=_set_chat_mode, args=("upload",))
         
         st.markdown('</div>', unsafe_allow_html=True)
     
     def render_stats(self):
         """Render chat statistics"""
         try:
-            response = requests.get("http://127.0.0.1:9000/kb/stats", timeout=5)
-            if response.status_code == 200:
-                stats = response.json()
+            stats = _fetch_kb_stats()
+            if stats is not None:
                 
                 st.markdown('<div class="stats-container">', unsafe_allow_html=True)
                 
@@ -272,21 +299,13 @@ class EnhancedChatInterface:
             st.info("💡 Start a conversation! Ask me anything or upload documents for RAG-powered responses.")
             return
         
-        for i, message in enumerate(st.session_state.chat_history):
-            if message['role'] == 'user':
-                st.markdown(f"""
-                <div class="user-message">
-                    {message['content']}
-                    <div class="message-timestamp">{message['timestamp']}</div>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class="assistant-message">
-                    {message['content']}
-                    <div class="message-timestamp">{message['timestamp']}</div>
-                </div>
-                """, unsafe_allow_html=True)
+        # one element for the whole history instead of one per message
+        parts: List[str] = []
+        ap = parts.append
+        for role, content, ts in map(_MSG_FIELDS, st.session_state.chat_history):
+            tmpl = _USER_TMPL if role == 'user' else _ASSIST_TMPL
+            ap(tmpl.format(c=escape(content).replace("\n", "<br>"), t=escape(ts)))
+        st.markdown("".join(parts), unsafe_allow_html=True)
     
     def render_chat_input(self):
         """Render enhanced chat input"""
@@ -331,13 +350,9 @@ class EnhancedChatInterface:
     
     def process_user_input(self, user_input: str):
         """Process user input and generate response"""
-        if user_input.startswith('/help'):
-            self.show_help()
-            return
-        
-        if user_input.startswith('/clear'):
-            st.session_state.chat_history = []
-            st.success("Chat history cleared!")
+        handler = _CMD_TABLE.get(user_input.split(" ", 1)[0])
+        if handler is not None:
+            handler(self)
             return
         
         # Add user message to history
@@ -374,10 +389,15 @@ class EnhancedChatInterface:
         finally:
             st.session_state.is_loading = False
     
+    def _clear_history(self):
+        """Handle /clear"""
+        st.session_state.chat_history = []
+        st.success("Chat history cleared!")
+    
     def get_chat_response(self, user_input: str) -> str:
         """Get chat response from backend"""
         try:
-            response = requests.post(
+            response = _SESSION.post(
                 "http://127.0.0.1:9000/chat",
                 json={"message": user_input},
                 timeout=30
@@ -398,7 +418,7 @@ class EnhancedChatInterface:
     def get_rag_response(self, user_input: str) -> str:
         """Get RAG-powered response from backend"""
         try:
-            response = requests.post(
+            response = _SESSION.post(
                 "http://127.0.0.1:9000/chat/stream",
                 json={"message": user_input, "use_rag": True},
                 timeout=60
@@ -478,6 +498,12 @@ class EnhancedChatInterface:
         self.render_error_messages()
         self.render_loading_state()
 
+# Slash commands handled by process_user_input, keyed by the first word
+_CMD_TABLE = {
+    "/help": EnhancedChatInterface.show_help,
+    "/clear": EnhancedChatInterface._clear_history,
+}
+
 # Usage
 def main():
     chat_interface = EnhancedChatInterface()
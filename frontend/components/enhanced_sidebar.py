@@ -5,25 +5,150 @@ Better navigation, settings, and user experience
 
 import streamlit as st
 import requests
+import threading
+import time
+from requests.adapters import HTTPAdapter
 from typing import Dict, Any, Optional
 import json
 
+# Loopback health probes reuse one small connection pool
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=2))
+
+_HEALTH_TTL_S = 5.0
+
+# st.fragment is stable from Streamlit 1.37; 1.36 ships it as experimental
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment")
+
+
+def _backend_health() -> bool:
+    """Probe backend /health; never raises."""
+    try:
+        # loopback: anything slower than 0.5s counts as down
+        return _SESSION.get("http://127.0.0.1:9000/health", timeout=0.5).status_code == 200
+    except Exception:
+        return False
+
+
+def _probe(state: Dict[str, Any]) -> None:
+    # Runs off the script thread, which has no ScriptRunContext, so it
+    # writes into the session's holder dict rather than st.session_state
+    try:
+        state["ok"] = _backend_health()
+        state["at"] = time.monotonic()
+    finally:
+        state["inflight"] = False
+
+
+# Static sidebar markup, built once at import
+_HEADER_HTML = """
+        <div style="text-align: center; padding: 20px 0;">
+            <h2 style="margin: 0; color: #667eea;">🧠</h2>
+            <h3 style="margin: 5px 0; color: #333;">Synapse</h3>
+            <p style="margin: 0; font-size: 0.8em; color: #666;">AI Assistant</p>
+        </div>
+        """
+
+_FOOTER_HTML = """
+        <div style="text-align: center; padding: 20px 0; font-size: 0.8em; color: #666;">
+            <p>Synapse v1.0</p>
+            <p>Powered by AI & RAG</p>
+        </div>
+        """
+
+_HELP_MD = """
+        **Quick Help:**
+        
+        **Navigation:**
+        - Use the sidebar to switch between different modes
+        - Chat: Regular AI conversation
+        - RAG: AI responses with document context
+        - Documents: Manage your knowledge base
+        
+        **Commands:**
+        - `/help` - Show help
+        - `/clear` - Clear chat history
+        
+        **Tips:**
+        - Upload documents first for better RAG responses
+        - Use specific questions for accuracy
+        - Check system status in the sidebar
+        """
+
+
+_NAV_DEBOUNCE_S = 0.3
+
+
+def _nav(page: str) -> None:
+    """Switch page, ignoring repeat clicks on the same page within the debounce window."""
+    now = time.monotonic()
+    last_page, last_at = st.session_state.get("_last_nav", (None, 0.0))
+    if page == last_page and now - last_at < _NAV_DEBOUNCE_S:
+        return
+    st.session_state._last_nav = (page, now)
+    st.session_state.current_page = page
+    st.rerun()
+
+
+def _system_status() -> None:
+    """System status block, rendered through one of the fragments below."""
+    st.markdown("### 📊 System Status")
+    
+    # Health check: show the last known status, refresh in the background
+    health = st.session_state._health
+    if not health["inflight"] and time.monotonic() - health["at"] >= _HEALTH_TTL_S:
+        health["inflight"] = True
+        threading.Thread(target=_probe, args=(health,), daemon=True).start()
+    if health["ok"] is None:
+        st.info("⏳ Checking backend...")
+    elif health["ok"]:
+        st.success("🟢 Backend Online")
+    else:
+        st.error("🔴 Backend Offline")
+    
+    # Memory usage (simulated)
+    memory_usage = 45.2  # This would come from actual system monitoring
+    st.metric("Memory Usage", f"{memory_usage}%")
+    
+    # Active connections (simulated)
+    active_connections = 1
+    st.metric("Active Connections", active_connections)
+    
+    # Last activity
+    if 'chat_history' in st.session_state and st.session_state.chat_history:
+        last_message = st.session_state.chat_history[-1]
+        st.caption(f"Last activity: {last_message['timestamp']}")
+    
+    st.divider()
+
+
+# Fragments rerun on their own, without the rest of the sidebar. run_every is
+# fixed at decoration time, so auto-refresh gets its own fragment
+_system_status_fragment = _fragment(_system_status)
+_system_status_live = _fragment(run_every="10s")(_system_status)
+
+
 class EnhancedSidebar:
     """Enhanced sidebar with better navigation and settings"""
     
+    _DEFAULTS = {
+        "sidebar_expanded": True,
+        "current_page": "chat",
+        "theme_mode": "light",
+        "sidebar_width": "wide",
+    }
+    
     def __init__(self):
         self.setup_session_state()
     
     def setup_session_state(self):
         """Initialize sidebar session state"""
-        if 'sidebar_expanded' not in st.session_state:
-            st.session_state.sidebar_expanded = True
-        if 'current_page' not in st.session_state:
-            st.session_state.current_page = "chat"
-        if 'theme_mode' not in st.session_state:
-            st.session_state.theme_mode = "light"
-        if 'sidebar_width' not in st.session_state:
-            st.session_state.sidebar_width = "wide"
+        for k, v in self._DEFAULTS.items():
+            st.session_state.setdefault(k, v)
+        # mutable per-session holder, so it can't live in _DEFAULTS
+        if '_health' not in st.session_state:
+            # last known probe result (ok=None until the first one lands)
+            st.session_state._health = {"ok": None, "at": 0.0, "inflight": False}
     
     def render(self):
         """Render the enhanced sidebar"""
@@ -37,13 +162,7 @@ class EnhancedSidebar:
     
     def render_header(self):
         """Render sidebar header"""
-        st.markdown("""
-        <div style="text-align: center; padding: 20px 0;">
-            <h2 style="margin: 0; color: #667eea;">🧠</h2>
-            <h3 style="margin: 5px 0; color: #333;">Synapse</h3>
-            <p style="margin: 0; font-size: 0.8em; color: #666;">AI Assistant</p>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(_HEADER_HTML, unsafe_allow_html=True)
         
         st.divider()
     
@@ -53,24 +172,19 @@ class EnhancedSidebar:
         
         # Main navigation
         if st.button("💬 Chat", key="nav_chat", use_container_width=True):
-            st.session_state.current_page = "chat"
-            st.rerun()
+            _nav("chat")
         
         if st.button("🔍 RAG Search", key="nav_rag", use_container_width=True):
-            st.session_state.current_page = "rag"
-            st.rerun()
+            _nav("rag")
         
         if st.button("📁 Documents", key="nav_docs", use_container_width=True):
-            st.session_state.current_page = "documents"
-            st.rerun()
+            _nav("documents")
         
         if st.button("⚙️ Settings", key="nav_settings", use_container_width=True):
-            st.session_state.current_page = "settings"
-            st.rerun()
+            _nav("settings")
         
         if st.button("📊 Analytics", key="nav_analytics", use_container_width=True):
-            st.session_state.current_page = "analytics"
-            st.rerun()
+            _nav("analytics")
         
         st.divider()
     
@@ -140,62 +254,19 @@ class EnhancedSidebar:
     
     def render_system_status(self):
         """Render system status information"""
-        st.markdown("### 📊 System Status")
-        
-        try:
-            # Health check
-            response = requests.get("http://127.0.0.1:9000/health", timeout=5)
-            if response.status_code == 200:
-                st.success("🟢 Backend Online")
-            else:
-                st.error("🔴 Backend Error")
-        except:
-            st.error("🔴 Backend Offline")
-        
-        # Memory usage (simulated)
-        memory_usage = 45.2  # This would come from actual system monitoring
-        st.metric("Memory Usage", f"{memory_usage}%")
-        
-        # Active connections (simulated)
-        active_connections = 1
-        st.metric("Active Connections", active_connections)
-        
-        # Last activity
-        if 'chat_history' in st.session_state and st.session_state.chat_history:
-            last_message = st.session_state.chat_history[-1]
-            st.caption(f"Last activity: {last_message['timestamp']}")
-        
-        st.divider()
+        # own render scope; polls every 10s when auto-refresh is on
+        if st.session_state.get("auto_refresh"):
+            _system_status_live()
+        else:
+            _system_status_fragment()
     
     def render_footer(self):
         """Render sidebar footer"""
-        st.markdown("""
-        <div style="text-align: center; padding: 20px 0; font-size: 0.8em; color: #666;">
-            <p>Synapse v1.0</p>
-            <p>Powered by AI & RAG</p>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(_FOOTER_HTML, unsafe_allow_html=True)
     
     def show_help_modal(self):
         """Show help modal"""
-        st.info("""
-        **Quick Help:**
-        
-        **Navigation:**
-        - Use the sidebar to switch between different modes
-        - Chat: Regular AI conversation
-        - RAG: AI responses with document context
-        - Documents: Manage your knowledge base
-        
-        **Commands:**
-        - `/help` - Show help
-        - `/clear` - Clear chat history
-        
-        **Tips:**
-        - Upload documents first for better RAG responses
-        - Use specific questions for accuracy
-        - Check system status in the sidebar
-        """)
+        st.info(_HELP_MD)
     
     def get_current_page(self) -> str:
         """Get current page from session state"""
@@ -0,0 +1,89 @@
+# frontend/components/kb_reindex.py
+"""
+Knowledge-base reindexing shared by the compose pane and the sidebar
+"""
+from __future__ import annotations
+
+import time
+from typing import Callable, Dict
+
+import streamlit as st
+
+# st.fragment is stable from Streamlit 1.37; 1.36 ships it as experimental
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment")
+
+# name -> clear() of each cache holding KB-derived data (stats, previews)
+_KB_CACHES: Dict[str, Callable[[], None]] = {}
+
+
+def register_kb_cache(name: str, clear: Callable[[], None]) -> None:
+    """Run clear() whenever the KB changes; registering a name again replaces it."""
+    _KB_CACHES[name] = clear
+
+
+def invalidate_kb_caches() -> None:
+    for clear in list(_KB_CACHES.values()):
+        clear()
+
+
+def start_reindex(client) -> bool:
+    """Reindex after a KB change; True if a background job was started.
+
+    The job id goes to session_state._reindex_job, which reindex_progress()
+    follows. Backends without background jobs are reindexed inline.
+    """
+    invalidate_kb_caches()
+    job_id = client.kb_reload_start()
+    if job_id is not None:
+        st.session_state._reindex_job = job_id
+        return True
+    with st.spinner("Reindexing…"):
+        client.kb_reload()
+    invalidate_kb_caches()
+    return False
+
+
+def upload_and_reindex(client, payload) -> bool:
+    """Upload files, indexing them once; True if a background job follows.
+
+    The backend reindexes as part of the upload (in the background when it
+    supports it), so no separate reload is requested.
+    """
+    with st.spinner("Uploading…"):
+        job_id = client.kb_upload(payload, background=True).get("job_id")
+    invalidate_kb_caches()
+    if job_id:
+        st.session_state._reindex_job = job_id
+        return True
+    return False  # older backend: already reindexed before replying
+
+
+@_fragment
+def reindex_progress() -> None:
+    """Progress bar for the background reindex in session_state._reindex_job.
+
+    Call it last in the run so the page is already drawn; any interaction
+    interrupts it and the next run re-subscribes to the same job.
+    """
+    job_id = st.session_state.get("_reindex_job")
+    if not job_id:
+        return
+    bar = st.progress(0.0, text="Reindexing…")
+    last_paint = 0.0
+    try:
+        for ev in st.session_state.backend_client.kb_reload_stream(job_id):
+            if ev.get("done"):
+                st.session_state._reindex_job = None
+                invalidate_kb_caches()
+                if ev.get("error"):
+                    st.error(f"Reindex failed: {ev['error']}")
+                else:
+                    bar.progress(1.0, text="KB updated")
+                return
+            now = time.monotonic()
+            if now - last_paint >= 0.1:
+                bar.progress(min(float(ev.get("progress") or 0.0), 1.0), text=ev.get("status") or "Reindexing…")
+                last_paint = now
+    except Exception as e:
+        st.session_state._reindex_job = None
+        st.error(f"Reindex failed: {e}")
@@ -8,6 +8,117 @@ from typing import Any, Dict, List
 import os
 import streamlit as st
 
+from frontend.components.kb_reindex import invalidate_kb_caches, register_kb_cache, start_reindex, upload_and_reindex
+
+# st.fragment is stable from Streamlit 1.37; 1.36 ships it as experimental
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment")
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _load_config(_client, base_url: str) -> Dict[str, Any]:
+    """Backend config shared by reruns and sessions for 30s.
+
+    Keyed on base_url only (_client is not hashed). app.py reads it too, and
+    both Apply buttons and Refresh clear it. Errors raise, so an offline
+    fallback is never cached.
+    """
+    return dict(_client.get_config())
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def _kb_stats_cached(_client, base_url: str) -> Dict[str, Any]:
+    """KB stats shared by reruns for 10s; cleared when the KB changes."""
+    return _client.get_kb_stats()
+
+
+register_kb_cache("kb_stats", _kb_stats_cached.clear)
+
+
+@_fragment
+def _kb_panel(client) -> None:
+    """KB stats, reload and upload.
+
+    A fragment, so an inline reindex reruns only this panel and the stats it
+    shows, not the chat and config forms. A background reindex job needs the
+    app's progress bar, so starting one reruns the app.
+    """
+    # Stats: slot on top, filled last so a reload/upload below is reflected
+    stats_slot = st.container()
+    started_job = False
+    kb_changed = False
+
+    # Controls
+    c1, c2 = st.columns(2)
+    with c1:
+        if st.button("🔄 Reload KB", use_container_width=True):
+            try:
+                started_job = start_reindex(client)
+                kb_changed = True
+                if not started_job:
+                    st.success("KB reindexed")
+            except Exception as e:
+                st.error(f"Reload failed: {e}")
+    with c2:
+        if st.button("📊 Show stats", use_container_width=True):
+            # the app handles this, so leave the fragment for a full rerun
+            st.session_state["_show_kb_stats"] = True
+            st.rerun()
+
+    # Uploads
+    st.caption("Upload files")
+    up = st.file_uploader(
+        "Choose files",
+        type=[
+            "txt",
+            "md",
+            "markdown",
+            "pdf",
+            "docx",
+            "rtf",
+            "html",
+            "htm",
+            "csv",
+            "json",
+            "xml",
+            "pptx",
+        ],
+        accept_multiple_files=True,
+        key="kb_upload_sidebar",
+    )
+    if up and st.button("📤 Upload & Reindex", use_container_width=True):
+        try:
+            payload: List[tuple] = []
+            for f in up:
+                f.seek(0)  # stream the UploadedFile instead of copying it
+                payload.append(
+                    (
+                        "files",
+                        f,
+                        f.type or "application/octet-stream",
+                        f.name,
+                    )
+                )
+            started_job = upload_and_reindex(client, payload)
+            kb_changed = True
+            if not started_job:
+                st.success("KB updated")
+        except Exception as e:
+            st.error(f"Upload failed: {e}")
+
+    if started_job:
+        st.rerun()  # full run: the app's reindex_progress follows the job
+
+    with stats_slot:
+        try:
+            prefetched = st.session_state.pop("_prefetched_kb_stats", None)
+            stats = (not kb_changed and prefetched) or _kb_stats_cached(client, client.base_url)
+            c1, c2, c3 = st.columns(3)
+            c1.metric("Documents", stats.get("total_files", stats.get("files", 0)))
+            c2.metric("Chunks", stats.get("total_chunks", stats.get("chunks", 0)))
+            c3.metric("Updated", stats.get("last_updated", "—"))
+        except Exception as e:
+            st.warning(f"KB stats unavailable: {e}")
+
 
 class Sidebar:
     """Main sidebar with controls and settings."""
@@ -87,10 +198,7 @@ class Sidebar:
 
         # cache config to avoid frequent GETs
         try:
-            cfg = st.session_state.get("_cached_config")
-            if cfg is None:
-                cfg = self.backend_client.get_config()
-                st.session_state["_cached_config"] = dict(cfg)  # copy
+            cfg = _load_config(self.backend_client, self.backend_client.base_url)
         except Exception as e:
             st.error(f"Config load failed: {e}")
             return actions
@@ -162,7 +270,9 @@ class Sidebar:
                         "system_prompt": system_prompt,
                     }
                     self.backend_client.update_config(patch)
-                    st.session_state["_cached_config"] = patch  # update cache
+                    _load_config.clear()  # shared with app.py; next run refetches
+                    # this run's chat requests use the new values too
+                    st.session_state.setdefault("config", {}).update(patch)
                     st.success("✅ Configuration updated")
                 except Exception as e:
                     st.error(f"Update failed: {e}")
@@ -177,6 +287,7 @@ class Sidebar:
                 try:
                     # Use backend API to clear KB
                     self.backend_client.clear_knowledge_base()
+                    invalidate_kb_caches()
                     st.success("✅ Knowledge Base cleared successfully!")
                     st.rerun()
                 except Exception as e:
@@ -199,69 +310,9 @@ class Sidebar:
         actions: Dict[str, Any] = {}
         st.markdown("### 📚 Knowledge Base")
 
-        # Stats
-        try:
-            stats = self.backend_client.get_kb_stats()
-            c1, c2, c3 = st.columns(3)
-            c1.metric("Documents", stats.get("total_files", stats.get("files", 0)))
-            c2.metric("Chunks", stats.get("total_chunks", stats.get("chunks", 0)))
-            c3.metric("Updated", stats.get("last_updated", "—"))
-        except Exception as e:
-            st.warning(f"KB stats unavailable: {e}")
-
-        # Controls
-        c1, c2 = st.columns(2)
-        with c1:
-            if st.button("🔄 Reload KB", use_container_width=True):
-                try:
-                    with st.spinner("Reindexing…"):
-                        self.backend_client.kb_reload()
-                    st.success("KB reindexed")
-                except Exception as e:
-                    st.error(f"Reload failed: {e}")
-        with c2:
-            if st.button("📊 Show stats", use_container_width=True):
-                actions["show_kb_stats"] = True
-
-        # Uploads
-        st.caption("Upload files")
-        up = st.file_uploader(
-            "Choose files",
-            type=[
-                "txt",
-                "md",
-                "markdown",
-                "pdf",
-                "docx",
-                "rtf",
-                "html",
-                "htm",
-                "csv",
-                "json",
-                "xml",
-                "pptx",
-            ],
-            accept_multiple_files=True,
-            key="kb_upload_sidebar",
-        )
-        if up and st.button("📤 Upload & Reindex", use_container_width=True):
-            try:
-                payload: List[tuple] = []
-                for f in up:
-                    payload.append(
-                        (
-                            "files",
-                            f.getvalue(),
-                            f.type or "application/octet-stream",
-                            f.name,
-                        )
-                    )
-                self.backend_client.kb_upload(payload)
-                with st.spinner("Reindexing…"):
-                    self.backend_client.kb_reload()
-                st.success("KB updated")
-            except Exception as e:
-                st.error(f"Upload failed: {e}")
+        _kb_panel(self.backend_client)
+        if st.session_state.pop("_show_kb_stats", False):
+            actions["show_kb_stats"] = True
 
         return actions
 
@@ -1,10 +1,32 @@
 #!/usr/bin/env python3
 import os, re, json
-from flask import Flask, request, Response
-import requests
 from pathlib import Path
 
-app = Flask(__name__)
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import ahocorasick  # optional: pyahocorasick
+except Exception:
+    ahocorasick = None  # pragma: no cover
+
+try:
+    import orjson
+except Exception:
+    orjson = None  # pragma: no cover
+
+# orjson on the per-chunk SSE path when available; _dumps returns bytes
+if orjson is not None:
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+else:  # pragma: no cover
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+app = FastAPI(title="guard proxy")
 
 ROOT = Path(__file__).resolve().parent
 WORKDIR = ROOT / "workdir"
@@ -14,25 +36,86 @@ PERSONA = json.loads((WORKDIR / "persona.json").read_text(encoding="utf-8")) if
 # downstream llama-server
 DOWNSTREAM = os.environ.get("LLAMA_DOWNSTREAM", "http://127.0.0.1:8080/v1/chat/completions")
 
-_re_redacts = []
-if POLICY.get("redact", {}).get("enabled"):
-    for p in POLICY["redact"].get("patterns", []):
-        _re_redacts.append(re.compile(p["regex"]))
+# keep-alive connections to llama-server, shared by all requests; async so
+# concurrent streams don't each hold a worker thread for a whole generation
+_CLIENT = httpx.AsyncClient(
+    timeout=600,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+)
+
+@app.on_event("shutdown")
+async def _close_client():
+    await _CLIENT.aclose()
+
+def _min_match_len(patterns) -> int:
+    # Shortest string any of the patterns can match (exact, from the regex
+    # parser); shorter strings, e.g. most single streamed tokens, skip the engine
+    try:
+        try:
+            from re import _parser as _sre_parse  # Python 3.11+
+        except ImportError:  # pragma: no cover
+            import sre_parse as _sre_parse
+        return min(_sre_parse.parse(rx.pattern, rx.flags).getwidth()[0] for rx in patterns)
+    except Exception:  # pragma: no cover
+        return 0
+
+def _compile_redactors(regexes: list) -> list:
+    """Compiled redact patterns, applied in order by redact_text().
+
+    Patterns are joined into one alternation (a single scan per string) only
+    when every one is plain: no groups, so no backreferences to renumber, and
+    no global inline flags such as (?i), which are only legal at the start of
+    a pattern. Otherwise each pattern keeps its own regex.
+    """
+    compiled = [re.compile(r) for r in regexes]
+    if not compiled:
+        return []
+    plain_flags = re.compile("").flags
+    if len(compiled) > 1 and all(rx.groups == 0 and rx.flags == plain_flags for rx in compiled):
+        return [re.compile("|".join(f"(?:{r})" for r in regexes))]
+    return compiled
+
+_REDACT_ON = bool(POLICY.get("redact", {}).get("enabled"))
+_REDACT_REPLACEMENT = POLICY.get("redact", {}).get("replacement", "[REDACTED]")
+_REDACTORS = _compile_redactors(
+    [p["regex"] for p in POLICY.get("redact", {}).get("patterns", [])] if _REDACT_ON else []
+)
+_MIN_MATCH_LEN = _min_match_len(_REDACTORS) if _REDACTORS else 0
+
+# Blocked topics are matched case-insensitively in one pass over the text:
+# an Aho-Corasick automaton when pyahocorasick is installed, else a regex union
+_BLOCKED_LOWER = [t.lower() for t in POLICY.get("blocked_topics", []) if t]
+_BLOCKED_AC = None
+_BLOCKED_RE = None
+if _BLOCKED_LOWER:
+    if ahocorasick is not None:
+        _BLOCKED_AC = ahocorasick.Automaton()
+        for _t in _BLOCKED_LOWER:
+            _BLOCKED_AC.add_word(_t, _t)
+        _BLOCKED_AC.make_automaton()
+    else:
+        _BLOCKED_RE = re.compile("|".join(map(re.escape, _BLOCKED_LOWER)))
 
 def redact_text(s: str) -> str:
-    if not POLICY.get("redact", {}).get("enabled"): 
+    if not _REDACTORS or len(s) < _MIN_MATCH_LEN:
         return s
-    replacement = POLICY["redact"].get("replacement", "[REDACTED]")
-    for rr in _re_redacts:
-        s = rr.sub(replacement, s)
+    for rx in _REDACTORS:
+        s = rx.sub(_REDACT_REPLACEMENT, s)
     return s
 
 def violates_blocked_topics(text: str) -> bool:
-    for topic in POLICY.get("blocked_topics", []):
-        if topic.lower() in text.lower():
-            return True
+    if _BLOCKED_AC is not None:
+        return next(_BLOCKED_AC.iter(text.lower()), None) is not None
+    if _BLOCKED_RE is not None:
+        return _BLOCKED_RE.search(text.lower()) is not None
     return False
 
+def _process_user_message(text: str):
+    """(redacted text, refused) for one user turn, in a single call per message."""
+    if violates_blocked_topics(text):
+        return None, True
+    return redact_text(text), False
+
 def clamp_sampling(payload: dict):
     # enforce caps
     mt = POLICY.get("max_tokens_cap")
@@ -43,35 +126,49 @@ def clamp_sampling(payload: dict):
         payload["temperature"] = min(payload.get("temperature", tc), tc)
     return payload
 
+# PERSONA never changes after load, so the system prefix is built once
+_PERSONA_PREFIX = "Persona:\n" + f"You are {PERSONA.get('name', 'Assistant')}." + "".join(
+    f"\n- {g}" for g in PERSONA.get("guidelines", [])
+)
+
 def ensure_persona_system(messages: list):
     # Prepend/refresh a short persona system message
-    persona_bits = []
-    name = PERSONA.get("name", "Assistant")
-    persona_bits.append(f"You are {name}.")
-    for g in PERSONA.get("guidelines", []):
-        persona_bits.append(f"- {g}")
-    system_line = "Persona:\n" + "\n".join(persona_bits)
     if messages and messages[0].get("role") == "system":
-        messages[0]["content"] = system_line + "\n\n" + messages[0]["content"]
+        messages[0]["content"] = _PERSONA_PREFIX + "\n\n" + messages[0]["content"]
     else:
-        messages.insert(0, {"role": "system", "content": system_line})
+        messages.insert(0, {"role": "system", "content": _PERSONA_PREFIX})
     return messages
 
-@app.route("/v1/chat/completions", methods=["POST"])
-def chat():
-    req = request.get_json(force=True, silent=True) or {}
+async def _aiter_byte_lines(r: httpx.Response):
+    # SSE lines as bytes: frames are never decoded to str, since both JSON
+    # loaders take bytes and the passthrough yields bytes unchanged
+    buf = b""
+    async for chunk in r.aiter_bytes():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r")
+    if buf:
+        yield buf.rstrip(b"\r")
+
+@app.post("/v1/chat/completions")
+async def chat(request: Request):
+    try:
+        req = _loads(await request.body()) or {}
+    except ValueError:
+        req = {}
     messages = req.get("messages", [])
 
     # Input redaction + topic check
     for m in messages:
         if m.get("role") == "user":
-            original = m.get("content", "")
-            if violates_blocked_topics(original):
+            content, refused = _process_user_message(m.get("content", ""))
+            if refused:
                 refusal = POLICY.get("refusal_message", "I can’t help with that.")
-                return Response(json.dumps({
+                return Response(_dumps({
                     "choices": [{"message": {"role":"assistant","content": refusal}}]
-                }), mimetype="application/json")
-            m["content"] = redact_text(original)
+                }), media_type="application/json")
+            m["content"] = content
 
     # Persona injection
     req["messages"] = ensure_persona_system(messages)
@@ -80,34 +177,11 @@ def chat():
     req = clamp_sampling(req)
 
     # Forward (streaming or not)
-    stream = bool(req.get("stream"))
-    r = requests.post(DOWNSTREAM, json=req, stream=stream, timeout=600)
-
-    def gen_stream():
-        for line in r.iter_lines(decode_unicode=True):
-            if not line:
-                continue
-            if not line.startswith("data: "):
-                yield line + "\n"
-                continue
-            data = line[6:].strip()
-            if data == "[DONE]":
-                yield "data: [DONE]\n"
-                break
-            try:
-                obj = json.loads(data)
-                delta = obj.get("choices", [{}])[0].get("delta", {})
-                if "content" in delta and isinstance(delta["content"], str):
-                    delta["content"] = redact_text(delta["content"])
-                    obj["choices"][0]["delta"] = delta
-                yield "data: " + json.dumps(obj, ensure_ascii=False) + "\n"
-            except Exception:
-                yield line + "\n"
-
-    if stream:
-        return Response(gen_stream(), mimetype="text/event-stream")
-    else:
-        out = r.json()
+    body = _dumps(req)
+    headers = {"Content-Type": "application/json"}
+    if not req.get("stream"):
+        r = await _CLIENT.post(DOWNSTREAM, content=body, headers=headers)
+        out = _loads(r.content)
         try:
             msg = out.get("choices", [{}])[0].get("message", {})
             if "content" in msg and isinstance(msg["content"], str):
@@ -115,8 +189,37 @@ def chat():
                 out["choices"][0]["message"] = msg
         except Exception:
             pass
-        return Response(json.dumps(out, ensure_ascii=False), mimetype="application/json")
+        return Response(_dumps(out), media_type="application/json")
+
+    r = await _CLIENT.send(_CLIENT.build_request("POST", DOWNSTREAM, content=body, headers=headers), stream=True)
+
+    async def gen_stream():
+        try:
+            async for line in _aiter_byte_lines(r):
+                if not line:
+                    continue
+                if not line.startswith(b"data: "):
+                    yield line + b"\n"
+                    continue
+                data = line[6:].strip()
+                if data == b"[DONE]":
+                    yield b"data: [DONE]\n"
+                    break
+                try:
+                    obj = _loads(data)
+                    delta = obj.get("choices", [{}])[0].get("delta", {})
+                    if "content" in delta and isinstance(delta["content"], str):
+                        delta["content"] = redact_text(delta["content"])
+                        obj["choices"][0]["delta"] = delta
+                    yield b"data: " + _dumps(obj) + b"\n"
+                except Exception:
+                    yield line + b"\n"
+        finally:
+            await r.aclose()  # hand the connection back to the pool
+
+    return StreamingResponse(gen_stream(), media_type="text/event-stream")
 
 if __name__ == "__main__":
     # Run the guard on 8081 by default
-    app.run(host="127.0.0.1", port=int(os.environ.get("GUARD_PORT", "8081")))
\ No newline at end of file
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.environ.get("GUARD_PORT", "8081")))
\ No newline at end of file
@@ -5,7 +5,9 @@ Run this to verify the solution works before deploying to Railway
 """
 
 import os
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add the project root to Python path
@@ -54,39 +56,41 @@ def test_external_embeddings():
         print(f"❌ Error: {e}")
         return False
 
-def test_build_size():
-    """Test that build requirements are minimal"""
-    print("\n📦 Testing Build Requirements Size...")
+def test_build_size(log=print):
+    """Test that build requirements are minimal (output goes through log)"""
+    log("\n📦 Testing Build Requirements Size...")
     
     try:
         # Check build requirements file
         build_req_file = "railway-build-requirements.txt"
         if os.path.exists(build_req_file):
-            with open(build_req_file, 'r') as f:
-                content = f.read()
-                lines = [line.strip() for line in content.split('\n') if line.strip() and not line.startswith('#')]
+            lines = [line.strip() for line in Path(build_req_file).read_text().splitlines()
+                     if line.strip() and not line.startswith('#')]
+            # bare distribution names ("Sentence_Transformers[x]>=2" -> "sentence-transformers")
+            pkg_names = {re.split(r"[\[<>=!~;@ ]", line, maxsplit=1)[0].lower().replace('_', '-')
+                         for line in lines}
                 
-            print(f"✅ Build requirements: {len(lines)} packages")
-            print("📋 Packages:")
+            log(f"✅ Build requirements: {len(lines)} packages")
+            log("📋 Packages:")
             for pkg in lines:
-                print(f"   • {pkg}")
+                log(f"   • {pkg}")
             
             # Check for heavy dependencies
             heavy_deps = ['torch', 'transformers', 'sentence-transformers', 'accelerate']
-            found_heavy = [dep for dep in heavy_deps if any(dep in pkg for pkg in lines)]
+            found_heavy = [dep for dep in heavy_deps if dep in pkg_names]
             
             if found_heavy:
-                print(f"⚠️  Warning: Found heavy dependencies: {found_heavy}")
+                log(f"⚠️  Warning: Found heavy dependencies: {found_heavy}")
                 return False
             else:
-                print("✅ No heavy dependencies found in build requirements")
+                log("✅ No heavy dependencies found in build requirements")
                 return True
         else:
-            print(f"❌ Build requirements file not found: {build_req_file}")
+            log(f"❌ Build requirements file not found: {build_req_file}")
             return False
             
     except Exception as e:
-        print(f"❌ Error checking build requirements: {e}")
+        log(f"❌ Error checking build requirements: {e}")
         return False
 
 def main():
@@ -94,11 +98,19 @@ def main():
     print("🚀 Synapse External Embeddings Test")
     print("=" * 50)
     
-    # Test 1: External embedding service
-    test1_passed = test_external_embeddings()
-    
-    # Test 2: Build requirements size
-    test2_passed = test_build_size()
+    # Test 2 (file I/O) runs alongside test 1 (network/model bound); its
+    # output is buffered and printed after test 1 so the two don't interleave
+    build_log = []
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        f2 = ex.submit(test_build_size, lambda *a, **kw: build_log.append((a, kw)))
+        
+        # Test 1: External embedding service
+        test1_passed = test_external_embeddings()
+        
+        # Test 2: Build requirements size
+        test2_passed = f2.result()
+    for a, kw in build_log:
+        print(*a, **kw)
     
     print("\n" + "=" * 50)
     print("📊 Test Results:")
@@ -0,0 +1,39 @@
+"""Light markdown -> HTML conversion in chat_interface."""
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from frontend.components.chat_interface import _markdown_to_html_safe_impl as to_html  # noqa: E402
+
+
+def test_fenced_code_contents_stay_literal():
+    md = "```py\nx = `y` * 2 * 3\n```"
+    assert to_html(md) == '<div class="code-block"><code>x = `y` * 2 * 3</code></div>'
+
+
+def test_inline_code_wins_over_emphasis():
+    assert to_html("use `a*b*c` here") == 'use <code class="inline-code">a*b*c</code> here'
+
+
+def test_bold_converts_and_single_stars_are_left_to_streamlit():
+    assert to_html("**bold** and *it*") == "<strong>bold</strong> and *it*"
+    assert to_html("a ** b") == "a ** b"
+
+
+def test_code_and_emphasis_nest_inside_bold():
+    assert to_html("**see `cfg` *now***") == '<strong>see <code class="inline-code">cfg</code> *now</strong>*'
+    assert to_html("*a **b** c*") == "*a <strong>b</strong> c*"
+
+
+def test_unclosed_fence_inside_bold():
+    assert to_html("**\n`\n\nba**```````*") == "<strong><br>`<br><br>ba</strong>```````*"
+
+
+def test_html_is_escaped_and_newlines_break():
+    assert to_html("<b>hi</b> & 'q'") == "&lt;b&gt;hi&lt;/b&gt; &amp; &#x27;q&#x27;"
+    assert to_html("line1\nline2") == "line1<br>line2"
+    assert to_html("plain text") == "plain text"
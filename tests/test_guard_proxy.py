@@ -0,0 +1,56 @@
+"""Redaction pattern handling in guard_proxy."""
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import guard_proxy  # noqa: E402
+
+
+@pytest.fixture
+def use_policy(monkeypatch):
+    """Install redact patterns the way guard_proxy does at import."""
+    def install(regexes, replacement="[R]"):
+        redactors = guard_proxy._compile_redactors(regexes)
+        monkeypatch.setattr(guard_proxy, "_REDACTORS", redactors)
+        monkeypatch.setattr(guard_proxy, "_MIN_MATCH_LEN", guard_proxy._min_match_len(redactors))
+        monkeypatch.setattr(guard_proxy, "_REDACT_REPLACEMENT", replacement)
+        return redactors
+    return install
+
+
+def test_plain_patterns_are_joined_into_one_regex(use_policy):
+    assert len(use_policy([r"secret", r"\d{3}-\d{4}"])) == 1
+    assert guard_proxy.redact_text("secret 555-1234 ok") == "[R] [R] ok"
+
+
+def test_backreferences_keep_their_own_regex(use_policy):
+    assert len(use_policy([r"(\d)\1{5}", r"(a)b\1"])) == 2
+    assert guard_proxy.redact_text("111111 aba") == "[R] [R]"
+
+
+def test_inline_global_flags_keep_their_own_regex(use_policy):
+    assert len(use_policy([r"(?i)secret", r"\d{3}-\d{4}"])) == 2
+    assert guard_proxy.redact_text("SeCrEt 555-1234") == "[R] [R]"
+
+
+def test_min_match_len_covers_every_pattern(use_policy):
+    use_policy([r"(?i)secret", r"\d{3}"])
+    assert guard_proxy._MIN_MATCH_LEN == 3
+    assert guard_proxy.redact_text("12") == "12"
+    assert guard_proxy.redact_text("123") == "[R]"
+
+
+def test_no_patterns_leaves_text_alone(use_policy):
+    use_policy([])
+    assert guard_proxy.redact_text("secret 555-1234") == "secret 555-1234"
+
+
+def test_invalid_pattern_still_raises():
+    with pytest.raises(re.error):
+        guard_proxy._compile_redactors([r"(unclosed"])